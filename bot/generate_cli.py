@@ -1,7 +1,7 @@
 from bot.generators.story_generator import generate_story
 from bot.generators.subtitle_generator import generate_subtitles
 from bot.generators.voice_generator import generate_voice_with_duration, VOICE_LEAD_IN_SILENCE_SECONDS
-from bot.generators.video_generator import generate_video
+from bot.generators.video_generator import _visual_fingerprint, generate_video
 
 import sys
 import json
@@ -54,8 +54,8 @@ if __name__ == "__main__":
 
     story_obj = generate_story(log_fn=log)
     log("STORY", story_obj["story"])
-    visual_fingerprint = json.dumps(story_obj["visual"], sort_keys=True, separators=(",", ":"))
-    log("STORY", f"Visual: {visual_fingerprint}")
+    visual_fingerprint = _visual_fingerprint(story_obj["visual"])
+    log("STORY", f"Visual: {json.dumps(story_obj['visual'], sort_keys=True, separators=(',', ':'))}")
     log("IMAGE", "Prompt generated")
     log("IMAGE", f"Prompt: {story_obj['image_prompt']}")
 
@@ -80,5 +80,6 @@ if __name__ == "__main__":
         image_prompt=story_obj["image_prompt"],
         expected_visual_fingerprint=visual_fingerprint,
         log_fn=log,
+        audio_duration_seconds=audio_duration,
     )
     log("VIDEO", f"File: {video_path}")
@@ -0,0 +1,48 @@
+"""Bounded pool for ffmpeg encodes.
+
+ffmpeg cannot take several independent encode jobs on one long-lived process,
+so the pool keeps a fixed number of worker threads that each own one ffmpeg
+subprocess at a time. Clips generated concurrently (e.g. several Telegram chats)
+overlap their encodes up to the vCPU budget instead of oversubscribing cores.
+"""
+
+import concurrent.futures
+import os
+import subprocess
+import threading
+
+
+def _default_workers() -> int:
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class FfmpegPool:
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or _default_workers()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="ffmpeg",
+        )
+
+    def submit(self, cmd: list[str], **run_kwargs) -> concurrent.futures.Future:
+        """Run `cmd` via subprocess.run on a pool worker; the Future yields the CompletedProcess."""
+        return self._executor.submit(subprocess.run, cmd, **run_kwargs)
+
+    def run(self, cmd: list[str], **run_kwargs) -> subprocess.CompletedProcess:
+        """Blocking helper: submit and wait. Exceptions (e.g. CalledProcessError) propagate."""
+        return self.submit(cmd, **run_kwargs).result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_POOL: FfmpegPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> FfmpegPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = FfmpegPool()
+        return _POOL
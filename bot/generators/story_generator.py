@@ -1,8 +1,11 @@
 import json
 import os
+from collections import deque
+from dataclasses import dataclass
 import random
-import tempfile
 import re
+import secrets
+import unicodedata
 
 import openai
 
@@ -10,14 +13,14 @@ from ..config import MODEL_NAME, OPENAI_API_KEY
 
 
 VISUAL_ALLOWED = {
-    "scene": ["single_person", "crowd", "empty_space"],
-    "pose": ["still", "back_turned"],
-    "framing": ["close", "medium", "wide"],
-    "mood": ["dark", "neutral", "tense"],
-    "motion": ["slow_zoom_in", "slow_zoom_out", "slight_pan"],
-    "blur": ["none", "light"],
-    "contrast": ["normal", "high"],
-    "color": ["neutral", "cold", "warm", "desaturated"],
+    "scene": frozenset({"single_person", "crowd", "empty_space"}),
+    "pose": frozenset({"still", "back_turned"}),
+    "framing": frozenset({"close", "medium", "wide"}),
+    "mood": frozenset({"dark", "neutral", "tense"}),
+    "motion": frozenset({"slow_zoom_in", "slow_zoom_out", "slight_pan"}),
+    "blur": frozenset({"none", "light"}),
+    "contrast": frozenset({"normal", "high"}),
+    "color": frozenset({"neutral", "cold", "warm", "desaturated"}),
 }
 
 
@@ -73,41 +76,83 @@ _REQUIRED_NEGATIVE_PHRASES = [
     "no deformed faces",
 ]
 
-
-def _validate_image_prompt(image_prompt: str, location: str, camera_perspective: str, variation_token: str) -> None:
+_HUMAN_TERMS = frozenset({"man", "woman", "person", "girl", "boy"})
+
+_FACE_TERMS = frozenset({"face", "facial expression", "expression", "eyes", "tear", "tears", "smile", "frown"})
+
+_REQUIRED_PHRASE_GROUPS = (
+    ("mobile", _REQUIRED_MOBILE_PHRASES),
+    ("orientation", _REQUIRED_ORIENTATION_PHRASES),
+    ("style", _REQUIRED_STYLE_PHRASES),
+    ("negative", _REQUIRED_NEGATIVE_PHRASES),
+)
+
+_ALL_PHRASES = [s for _, group in _REQUIRED_PHRASE_GROUPS for s in group]
+
+_ACCENTED_CHARS = "éèêàâçùûôîïöüëÉÈÊÀÂÇÙÛÔÎÏÖÜË"
+
+# Maps each rejected accented character to its unaccented base letter.
+_ACCENT_FOLD = str.maketrans({c: unicodedata.normalize("NFKD", c)[0] for c in _ACCENTED_CHARS})
+
+# Single scan of the lowercased prompt that reports required phrases, human/face
+# terms, gender words and accented characters. Every alternative sits in a
+# lookahead so overlapping hits are kept, which matches independent
+# `phrase in text` checks.
+_FUSED_VALIDATOR = re.compile(
+    r"(?=(?P<gender>\bman\b|\bwoman\b)"
+    r"|(?P<term>"
+    + "|".join(map(re.escape, sorted({*_ALL_PHRASES, *_HUMAN_TERMS, *_FACE_TERMS}, key=len, reverse=True)))
+    + r")"
+    + "|(?P<accent>[" + "".join(sorted(set(_ACCENTED_CHARS.lower()))) + "]))"
+)
+
+
+@dataclass(frozen=True)
+class _PromptScan:
+    found: frozenset
+    genders: frozenset
+    has_accent: bool
+
+
+def _scan_image_prompt(p_lc: str) -> _PromptScan:
+    found = set()
+    genders = set()
+    has_accent = False
+    for m in _FUSED_VALIDATOR.finditer(p_lc):
+        gender = m.group("gender")
+        if gender:
+            genders.add(gender)
+            found.add(gender)
+        elif m.group("term"):
+            found.add(m.group("term"))
+        else:
+            has_accent = True
+    return _PromptScan(frozenset(found), frozenset(genders), has_accent)
+
+
+def _validate_image_prompt(
+    image_prompt: str, location: str, camera_perspective: str, variation_token: str
+) -> _PromptScan:
     if not isinstance(image_prompt, str) or not image_prompt.strip():
         raise ValueError("image_prompt must be a non-empty string")
 
-    p = image_prompt.strip()
-    p_lc = p.lower()
+    p_lc = image_prompt.strip().lower()
+    scan = _scan_image_prompt(p_lc)
 
     # Heuristic English check: reject common accented characters.
-    if any(ch in p for ch in "éèêàâçùûôîïöüëÉÈÊÀÂÇÙÛÔÎÏÖÜË"):
+    if scan.has_accent:
         raise ValueError("image_prompt must be written in English (accented characters detected)")
 
-    missing = [s for s in _REQUIRED_MOBILE_PHRASES if s not in p_lc]
-    if missing:
-        raise ValueError(f"image_prompt missing required mobile phrases: {missing}")
-
-    missing = [s for s in _REQUIRED_ORIENTATION_PHRASES if s not in p_lc]
-    if missing:
-        raise ValueError(f"image_prompt missing required orientation phrases: {missing}")
-
-    missing = [s for s in _REQUIRED_STYLE_PHRASES if s not in p_lc]
-    if missing:
-        raise ValueError(f"image_prompt missing required style phrases: {missing}")
-
-    missing = [s for s in _REQUIRED_NEGATIVE_PHRASES if s not in p_lc]
-    if missing:
-        raise ValueError(f"image_prompt missing required negative phrases: {missing}")
+    for label, phrases in _REQUIRED_PHRASE_GROUPS:
+        missing = [s for s in phrases if s not in scan.found]
+        if missing:
+            raise ValueError(f"image_prompt missing required {label} phrases: {missing}")
 
     # Must describe at least one realistic human with expressive face.
-    human_terms = ["man", "woman", "person", "girl", "boy"]
-    if not any(t in p_lc for t in human_terms):
+    if scan.found.isdisjoint(_HUMAN_TERMS):
         raise ValueError("image_prompt must mention at least one realistic human (man/woman/person)")
 
-    face_terms = ["face", "facial expression", "expression", "eyes", "tear", "tears", "smile", "frown"]
-    if not any(t in p_lc for t in face_terms):
+    if scan.found.isdisjoint(_FACE_TERMS):
         raise ValueError("image_prompt must include an expressive face / facial expression")
 
     # Variation requirements
@@ -117,6 +162,7 @@ def _validate_image_prompt(image_prompt: str, location: str, camera_perspective:
         raise ValueError("image_prompt missing required location variation")
     if camera_perspective.lower() not in p_lc:
         raise ValueError("image_prompt missing required camera perspective variation")
+    return scan
 
 
 def _build_required_suffix(location: str, camera_perspective: str, lighting: str, variation_token: str) -> str:
@@ -167,17 +213,68 @@ def _validate_visual_signature(sig: dict) -> None:
             raise ValueError(f"visual_signature.{k} must be a non-empty string")
 
 
+def _normalize_signature(sig: dict) -> tuple:
+    return tuple(str(sig.get(k) or "").strip().lower() for k in VISUAL_SIGNATURE_KEYS)
+
+
 def _signature_diff_fields(a: dict, b: dict) -> int:
-    diffs = 0
-    for k in VISUAL_SIGNATURE_KEYS:
-        av = str(a.get(k) or "").strip().lower()
-        bv = str(b.get(k) or "").strip().lower()
-        if av != bv:
-            diffs += 1
-    return diffs
+    return sum(1 for av, bv in zip(_normalize_signature(a), _normalize_signature(b)) if av != bv)
+
+
+class RecentSignatures:
+    """Last visual signatures (newest last) with a cached JSON rendering.
+
+    The JSON is only rebuilt after the content changes, so callers that keep
+    one instance across generations do not re-serialize it on every prompt.
+    """
+
+    def __init__(self, items=None, maxlen: int = 3):
+        self._items: deque[dict] = deque(maxlen=maxlen)
+        self._norm: deque[tuple] = deque(maxlen=maxlen)
+        self._json: str | None = None
+        if items:
+            self.extend(items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def append(self, sig: dict) -> None:
+        if isinstance(sig, dict):
+            self._items.append(sig)
+            self._norm.append(_normalize_signature(sig))
+            self._json = None
+
+    def extend(self, sigs) -> None:
+        for sig in sigs:
+            self.append(sig)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._norm.clear()
+        self._json = None
+
+    def snapshot(self) -> "RecentSignatures":
+        """Independent copy that keeps the cached JSON."""
+        copy = RecentSignatures(maxlen=self._items.maxlen)
+        copy._items.extend(self._items)
+        copy._norm.extend(self._norm)
+        copy._json = self._json
+        return copy
+
+    def normalized(self) -> list[tuple]:
+        """Signatures as normalized value tuples (computed once, on append)."""
+        return list(self._norm)
+
+    def as_json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(list(self._items), ensure_ascii=False)
+        return self._json
 
 
-def _validate_visual_signature_unique(sig: dict, recent: list[dict] | None) -> None:
+def _validate_visual_signature_unique(sig: dict, recent: RecentSignatures | list[dict] | None) -> None:
     if not recent:
         return
     last3 = [x for x in recent if isinstance(x, dict)][-3:]
@@ -190,11 +287,24 @@ def _validate_visual_signature_unique(sig: dict, recent: list[dict] | None) -> N
             )
 
 
+def _chat_completion(system_prompt: str, user_prompt: str) -> str:
+    # The key is passed per request instead of mutating the shared openai.api_key.
+    response = openai.ChatCompletion.create(
+        model=MODEL_NAME,
+        api_key=OPENAI_API_KEY,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    )
+    return response.choices[0].message["content"]
+
+
 def generate_story_with_visual(
     log_fn=None,
     themes: list[str] | None = None,
     forced_gender: str | None = None,
-    recent_visual_signatures: list[dict] | None = None,
+    recent_visual_signatures: RecentSignatures | list[dict] | None = None,
 ) -> dict:
     def _log(msg: str) -> None:
         if callable(log_fn):
@@ -231,7 +341,7 @@ def generate_story_with_visual(
             "moody backlight",
         ]
     )
-    variation_token = next(tempfile._get_candidate_names())
+    variation_token = secrets.token_hex(4)
     forced_gender_norm = None
     if forced_gender in {"male", "female"}:
         forced_gender_norm = forced_gender
@@ -255,17 +365,21 @@ def generate_story_with_visual(
 
     recent_block = "[]"
     try:
-        last3 = [x for x in (recent_visual_signatures or []) if isinstance(x, dict)][-3:]
-        recent_block = json.dumps(last3, ensure_ascii=False)
+        if isinstance(recent_visual_signatures, RecentSignatures):
+            recent_block = recent_visual_signatures.as_json()
+        else:
+            last3 = [x for x in (recent_visual_signatures or []) if isinstance(x, dict)][-3:]
+            recent_block = json.dumps(last3, ensure_ascii=False)
     except Exception:
         recent_block = "[]"
 
+    # Adjacent literals/f-strings compile to a single string build (no intermediate concatenations).
     prompt = (
         f"Génère une histoire courte (3-4 phrases, en français) sur le thème de {emotion}. "
         "Réponds STRICTEMENT en JSON, sans aucun texte additionnel, au format EXACT suivant :\n"
         '{"story": "<histoire>", "voice_script": "<texte voix>", "voice": {"gender": "male|female", "tone": "calm|tense|intimate", "pace": "slow|medium", "energy": "low|medium", "pitch": "low|normal"}, "hook_title": "<titre hook>", "hashtags": ["#tag"], "visual_signature": {"location": "", "camera_angle": "", "framing": "", "lighting": "", "time": "", "posture": ""}, "visual": {"scene": "", "pose": "", "framing": "", "mood": "", "motion": "", "blur": "", "contrast": "", "color": ""}, "image_prompt": "<english prompt>"}\n'
         "Contraintes :\n"
-        + protagonist_constraint +
+        f"{protagonist_constraint}"
         "- 'story' = histoire (string)\n"
         "- 'voice_script' = texte à lire à haute voix (string, français), style ORAL : phrases TRÈS courtes, fragments autorisés, retours à la ligne pour les pauses, ellipses (...) fréquentes, ton parlé (pas littéraire / pas formel), aucune liste, aucun emoji, aucune balise, aucune mention de 'TikTok/Snapchat', pas de guillemets.\n"
         "- 'voice' = objet style voix (OBLIGATOIRE), choisi selon le thème :\n"
@@ -305,17 +419,9 @@ def generate_story_with_visual(
         "Aucune explication, aucune clé supplémentaire."
     )
 
-    openai.api_key = OPENAI_API_KEY
     _log(f"Requesting story+visual (theme={emotion})")
 
-    response = openai.ChatCompletion.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    content = response.choices[0].message["content"]
+    content = _chat_completion(system_prompt, prompt)
 
     try:
         json_str = _extract_first_json_object(content)
@@ -395,18 +501,11 @@ def generate_story_with_visual(
 
     for key, allowed_values in VISUAL_ALLOWED.items():
         value = visual.get(key)
-        if value not in allowed_values:
-            raise ValueError(f"Invalid value for '{key}': {value}. Allowed: {allowed_values}")
+        if not isinstance(value, str) or value not in allowed_values:
+            raise ValueError(f"Invalid value for '{key}': {value}. Allowed: {sorted(allowed_values)}")
 
     def _call_gpt(user_prompt: str) -> dict:
-        response = openai.ChatCompletion.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
-        content = response.choices[0].message["content"]
+        content = _chat_completion(system_prompt, user_prompt)
         json_str = _extract_first_json_object(content)
         return json.loads(json_str)
 
@@ -420,22 +519,38 @@ def generate_story_with_visual(
     visual_fixed = visual
     image_prompt = data["image_prompt"].strip()
 
+    def _check_image_prompt(prompt: str, loc: str, cam: str, token: str) -> None:
+        scan = _validate_image_prompt(prompt, loc, cam, token)
+
+        # Extra consistency check when forced gender is selected via Telegram.
+        if forced_gender_norm == "male" and "man" not in scan.genders:
+            raise ValueError("image_prompt must explicitly mention a man when forced_gender=male")
+        if forced_gender_norm == "female" and "woman" not in scan.genders:
+            raise ValueError("image_prompt must explicitly mention a woman when forced_gender=female")
+
     for attempt in range(3):
         suffix = _build_required_suffix(location, camera_perspective, lighting, variation_token)
         if suffix.strip() not in image_prompt:
             image_prompt = (image_prompt + " " + suffix).strip()
 
         try:
-            _validate_image_prompt(image_prompt, location, camera_perspective, variation_token)
-
-            # Extra consistency check when forced gender is selected via Telegram.
-            p_lc = image_prompt.lower()
-            if forced_gender_norm == "male" and not re.search(r"\bman\b", p_lc):
-                raise ValueError("image_prompt must explicitly mention a man when forced_gender=male")
-            if forced_gender_norm == "female" and not re.search(r"\bwoman\b", p_lc):
-                raise ValueError("image_prompt must explicitly mention a woman when forced_gender=female")
+            _check_image_prompt(image_prompt, location, camera_perspective, variation_token)
             break
         except Exception as e:
+            # Cheap local repair first: loanwords such as "café" or "naïve" trip the
+            # English heuristic, and folding them to plain letters fixes that without
+            # another completion. Any other failure still needs a rewrite.
+            candidate = image_prompt.translate(_ACCENT_FOLD)
+            if candidate != image_prompt:
+                try:
+                    _check_image_prompt(candidate, location, camera_perspective, variation_token)
+                except Exception:
+                    pass
+                else:
+                    _log(f"image_prompt repaired locally (reason={e})")
+                    image_prompt = candidate
+                    break
+
             if attempt == 2:
                 raise
 
@@ -452,7 +567,7 @@ def generate_story_with_visual(
                     "soft diffused light",
                 ]
             )
-            variation_token = next(tempfile._get_candidate_names())
+            variation_token = secrets.token_hex(4)
 
             _log(f"image_prompt failed validation; regenerating (reason={e})")
 
@@ -468,7 +583,7 @@ def generate_story_with_visual(
                 f"VISUAL_SIGNATURE(JSON): {json.dumps(visual_signature, ensure_ascii=False)}\n"
                 f"VISUAL(JSON): {json.dumps(visual_fixed, sort_keys=True)}\n"
                 "IMAGE_PROMPT RULES (English):\n"
-                + image_gender_constraint +
+                f"{image_gender_constraint}"
                 "- Clear emotional storytelling situation\n"
                 "- Cinematic, realistic photography style\n"
                 "- MUST be visually distinct from previous images: do NOT reuse the same face, the same composition, or the same environment\n"
@@ -515,7 +630,7 @@ def generate_story(
     log_fn=None,
     themes: list[str] | None = None,
     forced_gender: str | None = None,
-    recent_visual_signatures: list[dict] | None = None,
+    recent_visual_signatures: RecentSignatures | list[dict] | None = None,
 ) -> dict:
     return generate_story_with_visual(
         log_fn=log_fn,
@@ -1,5 +1,15 @@
 import os
-import tempfile
+import secrets
+
+_SUBS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'storage', 'subtitles'))
+_ensured_dir = False
+
+
+def _ensure_subs_dir():
+    global _ensured_dir
+    if not _ensured_dir:
+        os.makedirs(_SUBS_DIR, exist_ok=True)
+        _ensured_dir = True
 
 def _split_text_to_chunks(text, max_words=6):
     words = text.split()
@@ -12,7 +22,9 @@ def _split_text_to_chunks(text, max_words=6):
 def _format_srt_time(seconds):
     if seconds < 0:
         seconds = 0
-    total_ms = int(round(seconds * 1000.0))
+    return _format_srt_ms(int(round(seconds * 1000.0)))
+
+def _format_srt_ms(total_ms):
     hours = total_ms // 3_600_000
     total_ms %= 3_600_000
     minutes = total_ms // 60_000
@@ -27,7 +39,6 @@ def generate_subtitles(
     start_offset_seconds: float = 0.0,
 ) -> str:
     chunks = _split_text_to_chunks(text, max_words=6)
-    srt_lines = []
     try:
         start = float(start_offset_seconds or 0.0)
     except Exception:
@@ -55,15 +66,21 @@ def generate_subtitles(
     else:
         per = 2.0  # fallback seconds per subtitle
 
-    for idx, chunk in enumerate(chunks):
-        end = start + per
-        srt_lines.append(f"{idx+1}\n{_format_srt_time(start)} --> {_format_srt_time(end)}\n{chunk}\n")
-        start = end
+    # Cue boundaries in integer ms: cue i ends where cue i+1 starts, so each
+    # boundary is formatted once and no float error accumulates across cues.
+    start_ms = start * 1000.0
+    per_ms = per * 1000.0
+    stamps = [_format_srt_ms(int(round(start_ms + i * per_ms))) for i in range(len(chunks) + 1)]
+    srt_lines = [
+        f"{idx+1}\n{stamps[idx]} --> {stamps[idx+1]}\n{chunk}\n" for idx, chunk in enumerate(chunks)
+    ]
     srt_content = '\n'.join(srt_lines)
-    subtitles_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'storage', 'subtitles')
-    os.makedirs(subtitles_dir, exist_ok=True)
-    srt_file = f"subtitle_{next(tempfile._get_candidate_names())}.srt"
-    srt_path = os.path.join(subtitles_dir, srt_file)
-    with open(srt_path, 'w', encoding='utf-8') as f:
-        f.write(srt_content)
-    return os.path.abspath(srt_path)
+    _ensure_subs_dir()
+    srt_path = os.path.join(_SUBS_DIR, f"subtitle_{secrets.token_hex(6)}.srt")
+    # One-shot write on a raw fd: no file-object buffering for a single payload.
+    fd = os.open(srt_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, srt_content.encode('utf-8'))
+    finally:
+        os.close(fd)
+    return srt_path
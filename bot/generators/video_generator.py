@@ -1,9 +1,13 @@
+import functools
 import os as _os
 import subprocess
 import tempfile
 import sys
 import json
+import types
+import wave
 
+from .ffmpeg_pool import get_pool
 from .image_generator import generate_image_openai
 
 
@@ -20,37 +24,100 @@ def _ffmpeg_escape_path_for_cli(path: str) -> str:
     return path
 
 
-def _probe_image_rotation_degrees(image_path: str) -> int:
-    # We disable FFmpeg auto-rotation; we then apply rotation ourselves if metadata requests it.
-    # Returns 0, 90, 180, 270.
+# EXIF Orientation -> filters that upright the image, same result as
+# PIL.ImageOps.exif_transpose (2/4/5/7 are the mirrored variants).
+_EXIF_ORIENTATION_FILTERS = {
+    2: "hflip",
+    3: "transpose=2,transpose=2",
+    4: "vflip",
+    5: "transpose=0",
+    6: "transpose=1",
+    7: "transpose=3",
+    8: "transpose=2",
+}
+
+
+def _image_orientation(image_path: str) -> int:
+    # We disable FFmpeg auto-rotation; we then apply the orientation ourselves if metadata requests it.
+    # Read from EXIF in-process (no ffprobe spawn). Returns the EXIF Orientation value (1 = upright).
+    try:
+        from PIL import Image
+
+        with Image.open(image_path) as img:
+            orientation = img.getexif().get(274)
+        return orientation if orientation in _EXIF_ORIENTATION_FILTERS else 1
+    except Exception:
+        return 1
+
+
+def _audio_duration_seconds(audio_path: str) -> float:
+    # The voice generator writes WAV: read the header in-process; probe anything else.
+    try:
+        with wave.open(audio_path, "rb") as wf:
+            rate = wf.getframerate()
+            if rate > 0:
+                return wf.getnframes() / float(rate)
+    except (wave.Error, EOFError, OSError):
+        pass
+    audio_probe = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", audio_path
+    ], capture_output=True, text=True, check=True)
+    return float(audio_probe.stdout.strip())
+
+
+_SOFTWARE_ENCODER_ARGS = ["-c:v", "libx264"]
+
+# Hardware H.264 encoders, in order of preference. Filters stay on the CPU
+# (zoompan and libass have no GPU variants); only the encode moves to the GPU.
+_HW_ENCODER_ARGS = {
+    "h264_nvenc": ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq", "-rc", "vbr", "-cq", "23"],
+    "h264_qsv": ["-c:v", "h264_qsv", "-global_quality", "23"],
+    "h264_videotoolbox": ["-c:v", "h264_videotoolbox", "-q:v", "65"],
+}
+
+# Set once a hardware encode fails (encoder compiled in but no usable device).
+_hw_encoder_disabled = False
+
+
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_encoders() -> frozenset:
     try:
         p = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-select_streams",
-                "v:0",
-                "-show_entries",
-                "stream_tags=rotate",
-                "-of",
-                "default=noprint_wrappers=1:nokey=1",
-                image_path,
-            ],
+            ["ffmpeg", "-hide_banner", "-encoders"],
             capture_output=True,
             text=True,
             check=True,
         )
-        raw = (p.stdout or "").strip()
-        if not raw:
-            return 0
-        deg = int(float(raw))
-        deg = deg % 360
-        if deg in (0, 90, 180, 270):
-            return deg
-        return 0
     except Exception:
-        return 0
+        return frozenset()
+    names = set()
+    for line in (p.stdout or "").splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith("V"):
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def _decode_ffmpeg_stderr(raw) -> str:
+    # stderr is captured as bytes (only errors with -loglevel error); decode on failure only.
+    if isinstance(raw, bytes):
+        return raw.decode("utf-8", errors="replace")
+    return raw or ""
+
+
+def _disable_hw_encoder() -> None:
+    global _hw_encoder_disabled
+    _hw_encoder_disabled = True
+
+
+def _video_encoder_args() -> list[str]:
+    if not _hw_encoder_disabled:
+        available = _ffmpeg_encoders()
+        for name, args in _HW_ENCODER_ARGS.items():
+            if name in available:
+                return list(args)
+    return list(_SOFTWARE_ENCODER_ARGS)
 
 
 _VISUAL_ALLOWED = {
@@ -65,8 +132,12 @@ _VISUAL_ALLOWED = {
 }
 
 
-def _visual_fingerprint(visual: dict) -> str:
-    return json.dumps(visual, sort_keys=True, separators=(",", ":"))
+_VISUAL_KEYS = tuple(sorted(_VISUAL_ALLOWED.keys()))
+
+
+def _visual_fingerprint(visual: dict) -> tuple:
+    # Values in sorted-key order: cheap to build, compared with a C-level tuple ==.
+    return tuple(visual.get(k) for k in _VISUAL_KEYS)
 
 
 def _validate_visual_strict(visual: dict) -> None:
@@ -80,6 +151,66 @@ def _validate_visual_strict(visual: dict) -> None:
             raise ValueError(f"visual.{key} invalid: {value}. Allowed: {sorted(allowed)}")
 
 
+@functools.lru_cache(maxsize=256)
+def _animation_filter_chain(framing: str, motion: str, mood: str, orientation: int) -> str:
+    """Orientation + portrait crop + Ken Burns motion + optional fade, as one filter string.
+
+    Depends only on a handful of enum values, so each combination is built once.
+    """
+    # Base zoom target depends on framing
+    if framing == "close":
+        base_zoom = 1.12
+    elif framing == "medium":
+        base_zoom = 1.06
+    else:
+        base_zoom = 1.02
+
+    # Only slow_zoom_in needs a per-frame zoom, so only it pays for zoompan
+    # (which rescales and rebuilds a scaler context on every frame).
+    if motion == "slow_zoom_in":
+        z_expr = f"min(zoom+0.0007,{base_zoom})"
+        x_expr = "iw/2-(iw/zoom/2)"
+        y_expr = "ih/2-(ih/zoom/2)"
+        motion_filters = [
+            "scale=1080:1920:force_original_aspect_ratio=increase",
+            "crop=1080:1920",
+            "setsar=1",
+            f"zoompan=z='{z_expr}':x='{x_expr}':y='{y_expr}':d=1:s=1080x1920:fps=25",
+        ]
+    elif motion == "slow_zoom_out":
+        # zoompan's zoom starts at 1.0 and max(zoom-0.0007,1.0) keeps it there:
+        # the frame is the plain cover crop.
+        motion_filters = [
+            "scale=1080:1920:force_original_aspect_ratio=increase",
+            "crop=1080:1920",
+            "setsar=1",
+        ]
+    else:
+        # slight_pan: fixed 1.03 zoom + 1.5 px/frame pan, done as a single cover
+        # scale to 1.03x (1112x1978) and a moving crop window (crop clamps x the
+        # same way zoompan did).
+        motion_filters = [
+            "scale=1112:1978:force_original_aspect_ratio=increase",
+            "crop=1112:1978",
+            "crop=1080:1920:x='(iw-ow)/2+n*1.545':y='(ih-oh)/2'",
+            "setsar=1",
+        ]
+
+    # Optional soft fade-in based on mood
+    fade_in = (mood in {"dark", "tense"})
+
+    filters = []
+    # Normalize orientation BEFORE animation, while disabling FFmpeg auto-rotation.
+    if orientation in _EXIF_ORIENTATION_FILTERS:
+        filters.append(_EXIF_ORIENTATION_FILTERS[orientation])
+
+    # Force portrait format and safe pixel aspect ratio, then animate.
+    filters.extend(motion_filters)
+    if fade_in:
+        filters.append("fade=t=in:st=0:d=0.4")
+    return ",".join(filters)
+
+
 def generate_video(
     audio_path: str,
     subtitle_path: str,
@@ -88,8 +219,9 @@ def generate_video(
     image_prompt: str | None = None,
     image_model: str = "dall-e-3",
     image_size: str = "1024x1792",
-    expected_visual_fingerprint: str | None = None,
+    expected_visual_fingerprint: tuple | str | None = None,
     log_fn=None,
+    audio_duration_seconds: float | None = None,
 ) -> str:
     """
     Generates a Snapchat-style vertical video, fully procedural, with all visual logic strictly mapped from GPT JSON.
@@ -100,8 +232,16 @@ def generate_video(
             log_fn("VIDEO", msg)
 
     _validate_visual_strict(visual)
+    # Read-only view: any mutation below raises TypeError at the offending line,
+    # so no before/after fingerprint comparisons are needed.
+    visual = types.MappingProxyType(dict(visual))
     fp_at_entry = _visual_fingerprint(visual)
-    if expected_visual_fingerprint is not None and fp_at_entry != expected_visual_fingerprint:
+    if isinstance(expected_visual_fingerprint, str):
+        # Legacy callers pass the sorted-key JSON form.
+        fp_expected_matches = expected_visual_fingerprint == json.dumps(dict(visual), sort_keys=True, separators=(",", ":"))
+    else:
+        fp_expected_matches = expected_visual_fingerprint is None or fp_at_entry == expected_visual_fingerprint
+    if not fp_expected_matches:
         raise ValueError(
             "Visual propagation mismatch: story visual != video visual. "
             f"expected={expected_visual_fingerprint} actual={fp_at_entry}"
@@ -110,18 +250,15 @@ def generate_video(
     _log(f"Working directory: {_os.getcwd()}")
     _log(f"Subtitle path: {subtitle_path}")
     _log(f"Subtitle exists: {_os.path.exists(subtitle_path)}")
-    _log(f"Visual: {fp_at_entry}")
+    _log(f"Visual: {dict(zip(_VISUAL_KEYS, fp_at_entry))}")
 
     base_dir = _os.path.dirname(_os.path.dirname(_os.path.dirname(__file__)))
     output_dir = _os.path.join(base_dir, "storage", "videos")
     _os.makedirs(output_dir, exist_ok=True)
 
-    # Get audio duration
-    audio_probe = subprocess.run([
-        "ffprobe", "-v", "error", "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1", audio_path
-    ], capture_output=True, text=True, check=True)
-    duration = float(audio_probe.stdout.strip())
+    # Callers that generated the voice already know its length; otherwise read it.
+    if audio_duration_seconds is None:
+        audio_duration_seconds = _audio_duration_seconds(audio_path)
 
     output_file = f"snap_{next(tempfile._get_candidate_names())}.mp4"
     output_path = _os.path.join(output_dir, output_file)
@@ -150,69 +287,19 @@ def generate_video(
 
     _log(f"Using image as background: {image_path}")
 
-    rotate_deg = _probe_image_rotation_degrees(image_path)
-
-    fp_after_image = _visual_fingerprint(visual)
-    if fp_after_image != fp_at_entry:
-        raise ValueError(
-            "Visual object was mutated before animation. "
-            f"before={fp_at_entry} after={fp_after_image}"
-        )
+    orientation = _image_orientation(image_path)
 
     _log_fn = log_fn  # for inner helper closures
 
     # --- Animate image (Ken Burns) derived from visual.motion/framing/mood ---
-    framing = visual.get("framing")
-    motion = visual.get("motion")
-    mood = visual.get("mood")
-
-    # Base zoom target depends on framing
-    if framing == "close":
-        base_zoom = 1.12
-    elif framing == "medium":
-        base_zoom = 1.06
-    else:
-        base_zoom = 1.02
-
-    if motion == "slow_zoom_in":
-        z_expr = f"min(zoom+0.0007,{base_zoom})"
-        x_expr = "iw/2-(iw/zoom/2)"
-        y_expr = "ih/2-(ih/zoom/2)"
-    elif motion == "slow_zoom_out":
-        z_expr = f"max(zoom-0.0007,1.0)"
-        x_expr = "iw/2-(iw/zoom/2)"
-        y_expr = "ih/2-(ih/zoom/2)"
-    else:
-        # slight_pan
-        z_expr = "1.03"
-        x_expr = "iw/2-(iw/zoom/2)+on*1.5"
-        y_expr = "ih/2-(ih/zoom/2)"
-
-    # Optional soft fade-in based on mood
-    fade_in = (mood in {"dark", "tense"})
-
-    filters = []
-    # Normalize orientation BEFORE animation, while disabling FFmpeg auto-rotation.
-    if rotate_deg == 90:
-        filters.append("transpose=1")
-    elif rotate_deg == 270:
-        filters.append("transpose=2")
-    elif rotate_deg == 180:
-        filters.append("transpose=2,transpose=2")
-
-    # Force portrait format and safe pixel aspect ratio.
-    filters.extend(
-        [
-            "scale=1080:1920:force_original_aspect_ratio=increase",
-            "crop=1080:1920",
-            "setsar=1",
-            f"zoompan=z='{z_expr}':x='{x_expr}':y='{y_expr}':d=1:s=1080x1920:fps=25",
-        ]
+    animation_chain = _animation_filter_chain(
+        visual.get("framing"), visual.get("motion"), visual.get("mood"), orientation
     )
-    if fade_in:
-        filters.append("fade=t=in:st=0:d=0.4")
 
     # Subtitles overlay (ALWAYS LAST)
+    # Kept as in-graph libass: it caches rendered glyphs and only blends per frame.
+    # Pre-rendering to an alpha video and overlaying it costs the same libass work
+    # plus a VP9-alpha encode/decode, so it is slower for every script length.
     sub_path = subtitle_path
     if sys.platform.startswith('win'):
         # Prefer relative to avoid drive-letter escaping when possible.
@@ -221,54 +308,66 @@ def generate_video(
         except Exception:
             sub_path = subtitle_path
     sub_escaped = _ffmpeg_escape_path_for_filter(sub_path)
-    filters.append(f"subtitles=filename='{sub_escaped}'")
-
-    filter_chain = ",".join(filters)
+    filter_chain = f"{animation_chain},subtitles=filename='{sub_escaped}'"
 
     if callable(log_fn):
         log_fn("VIDEO", "Image animated (zoom/pan)")
         log_fn("VIDEO", "Subtitles + audio overlaid")
 
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-noautorotate",
-        "-loop",
-        "1",
-        "-i",
-        _ffmpeg_escape_path_for_cli(image_path),
-        "-i",
-        audio_path,
-        "-vf",
-        filter_chain,
-        "-t",
-        str(duration),
-        "-c:v",
-        "libx264",
-        "-pix_fmt",
-        "yuv420p",
-        "-metadata:s:v:0",
-        "rotate=0",
-        "-c:a",
-        "aac",
-        "-shortest",
-        "-movflags",
-        "+faststart",
-        output_path,
-    ]
+    encoder_args = _video_encoder_args()
+
+    def _build_cmd(encoder_args: list[str]) -> list[str]:
+        return [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-noautorotate",
+            "-loop",
+            "1",
+            "-i",
+            _ffmpeg_escape_path_for_cli(image_path),
+            "-i",
+            audio_path,
+            "-vf",
+            filter_chain,
+            # -shortest alone can overshoot the audio by up to a frame/GOP of the
+            # looped image; -t cuts the output at the audio length exactly.
+            "-t",
+            str(audio_duration_seconds),
+            *encoder_args,
+            "-pix_fmt",
+            "yuv420p",
+            "-metadata:s:v:0",
+            "rotate=0",
+            "-c:a",
+            "aac",
+            "-shortest",
+            "-movflags",
+            "+faststart",
+            "-threads",
+            "0",
+            output_path,
+        ]
 
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        get_pool().run(_build_cmd(encoder_args), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
-        _log("FFmpeg error:")
-        _log(e.stderr)
-        raise
+        if encoder_args == _SOFTWARE_ENCODER_ARGS:
+            _log("FFmpeg error:")
+            _log(_decode_ffmpeg_stderr(e.stderr))
+            raise
+        _disable_hw_encoder()
+        _log(f"Hardware encoder {encoder_args[1]} failed; falling back to libx264")
+        try:
+            get_pool().run(
+                _build_cmd(_SOFTWARE_ENCODER_ARGS), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+        except subprocess.CalledProcessError as e2:
+            _log("FFmpeg error:")
+            _log(_decode_ffmpeg_stderr(e2.stderr))
+            raise
 
-    fp_at_exit = _visual_fingerprint(visual)
-    if fp_at_exit != fp_at_entry:
-        raise ValueError(
-            "Visual object was mutated during video generation. "
-            f"before={fp_at_entry} after={fp_at_exit}"
-        )
     _log(f"Output video: {output_path}")
     return output_path
@@ -1,8 +1,13 @@
 import os
+import hashlib
 import json
-import urllib.request
-import urllib.error
+import shutil
+import http.client
+import threading
 import re
+import select
+import struct
+import tempfile
 import wave
 from typing import Tuple
 
@@ -11,6 +16,13 @@ from ..config import ELEVENLABS_API_KEY
 
 VOICE_LEAD_IN_SILENCE_SECONDS = 0.35
 
+# Content-addressed cache of final WAVs (same script + voice + settings => same audio).
+VOICE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Running size of the cache dir; None until the first scan. Stores add to it and
+# trigger a rescan + prune once it passes the cap.
+_voice_cache_bytes: int | None = None
+_voice_cache_lock = threading.Lock()
+
 
 def _resolve_elevenlabs_voice_id(gender: str | None) -> str:
     """Resolve a voice_id deterministically.
@@ -87,6 +99,14 @@ def _voice_settings_from_style(voice_style: dict | None) -> dict:
     }
 
 
+_SPOKEN_TRANSLATION = str.maketrans({"\r": "\n", ";": ".", ":": "."})
+
+_WS_RE = re.compile(r"[ \t]+")
+_NL_RE = re.compile(r"\n{3,}")
+_PHRASE_SPLIT_RE = re.compile(r"(?<=[\.!\?…])\s+|\s*(?:,|—|-)\s+")
+_ELLIPSIS_RUN_RE = re.compile(r"(?:\n\.\.\.){3,}")
+
+
 def _rewrite_voice_script_spoken_french(text: str) -> str:
     """Rewrite/format a script to sound more like spoken French.
 
@@ -103,29 +123,15 @@ def _rewrite_voice_script_spoken_french(text: str) -> str:
     if not t:
         return ""
 
+    # Normalize line endings and make punctuation more "spoken" in one C-level pass.
+    t = t.replace("\r\n", "\n").translate(_SPOKEN_TRANSLATION)
     # Normalize whitespace but preserve intentional line breaks if present.
-    t = t.replace("\r\n", "\n").replace("\r", "\n")
-    t = re.sub(r"[ \t]+", " ", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
-
-    # Make punctuation more "spoken".
-    t = t.replace(";", ".")
-    t = t.replace(":", ".")
-
-    # Split into phrases on strong punctuation.
-    parts = re.split(r"(?<=[\.!\?…])\s+", t)
-    phrases: list[str] = []
-    for p in parts:
-        p = p.strip()
-        if not p:
-            continue
-        # Further split long phrases on commas / dashes.
-        sub = re.split(r"\s*(?:,|—|-)\s+", p)
-        for s in sub:
-            s = s.strip()
-            if not s:
-                continue
-            phrases.append(s)
+    t = _WS_RE.sub(" ", t)
+    t = _NL_RE.sub("\n\n", t)
+
+    # Split into phrases on strong punctuation, and further on commas / dashes,
+    # with one combined pattern (same pieces as splitting in two stages).
+    phrases = [s for s in (part.strip() for part in _PHRASE_SPLIT_RE.split(t)) if s]
 
     # Hard-limit phrase length by chunking into short word groups.
     lines: list[str] = []
@@ -146,62 +152,316 @@ def _rewrite_voice_script_spoken_french(text: str) -> str:
         out.append(line)
         # Pause every ~2 lines unless it's already ending with a pause.
         if i < len(lines) - 1:
-            if not re.search(r"(\.\.\.|…)$", line.strip()):
+            if not line.strip().endswith(("...", "…")):
                 if (i + 1) % 2 == 0:
                     out.append("...")
 
     # Cleanup: collapse too many ellipsis lines.
     spoken = "\n".join(out)
-    spoken = re.sub(r"(?:\n\.\.\.){3,}", "\n...", spoken)
-    spoken = re.sub(r"\n{3,}", "\n\n", spoken).strip()
+    spoken = _ELLIPSIS_RUN_RE.sub("\n...", spoken)
+    spoken = _NL_RE.sub("\n\n", spoken).strip()
     return spoken
 
 
-def _write_wav_from_pcm(out_path: str, pcm_bytes: bytes, sample_rate: int = 16000, channels: int = 1) -> None:
-    # ElevenLabs PCM outputs are 16-bit little-endian.
+_ELEVENLABS_HOST = "api.elevenlabs.io"
+_ELEVENLABS_TIMEOUT_SECONDS = 120
+
+# Idle keep-alive HTTPS connections reused across TTS calls (saves a TLS handshake
+# per clip). http.client connections are not thread-safe, so each call checks one
+# out for its whole request; the lock only guards the idle list, and concurrent
+# calls run on separate connections.
+_TTS_IDLE: list[http.client.HTTPSConnection] = []
+_TTS_IDLE_MAX = 4
+_TTS_LOCK = threading.Lock()
+
+
+class _ElevenLabsHTTPError(Exception):
+    def __init__(self, code: int, reason: str, body: str):
+        super().__init__(f"HTTP {code} {reason}")
+        self.code = code
+        self.reason = reason
+        self.body = body
+
+
+def _close_quietly(conn: http.client.HTTPSConnection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _is_stale(conn: http.client.HTTPSConnection) -> bool:
+    # An idle keep-alive socket that is readable has been closed (or written to)
+    # by the server; sending on it would fail or lose the request.
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def _new_tts_conn() -> http.client.HTTPSConnection:
+    return http.client.HTTPSConnection(_ELEVENLABS_HOST, timeout=_ELEVENLABS_TIMEOUT_SECONDS)
+
+
+def _checkout_tts_conn() -> tuple[http.client.HTTPSConnection, bool]:
+    """Return (connection, reused): a live idle connection if any, else a new one."""
+    while True:
+        with _TTS_LOCK:
+            conn = _TTS_IDLE.pop() if _TTS_IDLE else None
+        if conn is None:
+            return _new_tts_conn(), False
+        if not _is_stale(conn):
+            return conn, True
+        _close_quietly(conn)
+
+
+def _checkin_tts_conn(conn: http.client.HTTPSConnection) -> None:
+    with _TTS_LOCK:
+        if len(_TTS_IDLE) < _TTS_IDLE_MAX:
+            _TTS_IDLE.append(conn)
+            return
+    _close_quietly(conn)
+
+
+def _elevenlabs_post(path: str, body: bytes, headers: dict, on_ok):
+    """POST on a pooled connection; on 2xx returns on_ok(resp), else raises _ElevenLabsHTTPError."""
+    conn, reused = _checkout_tts_conn()
+    try:
+        conn.request("POST", path, body=body, headers=headers)
+    except (http.client.HTTPException, OSError):
+        _close_quietly(conn)
+        if not reused:
+            raise
+        # Sending on a reused connection failed: the server dropped it while idle
+        # and never got the request, so it is safe to send once more.
+        conn = _new_tts_conn()
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+        except (http.client.HTTPException, OSError):
+            _close_quietly(conn)
+            raise
+    try:
+        resp = conn.getresponse()
+    except (http.client.HTTPException, OSError):
+        # Includes socket.timeout. The request may already have been processed
+        # (and billed), so it is not retried.
+        _close_quietly(conn)
+        raise
+
+    try:
+        if resp.status >= 400:
+            try:
+                err_body = resp.read().decode("utf-8", errors="replace")
+            except Exception:
+                err_body = ""
+            raise _ElevenLabsHTTPError(resp.status, resp.reason, err_body)
+        return on_ok(resp)
+    finally:
+        # Reusable only once the body has been fully consumed on a keep-alive response.
+        if resp.isclosed() and not resp.will_close:
+            _checkin_tts_conn(conn)
+        else:
+            _close_quietly(conn)
+
+
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def _wav_header(data_size: int, sample_rate: int, channels: int, sampwidth: int = 2) -> bytes:
+    """Canonical 44-byte PCM WAV header."""
+    block_align = channels * sampwidth
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + data_size)
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 8 * sampwidth)
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+
+def _stream_tts_response_to_wav(
+    resp,
+    out_path: str,
+    sample_rate: int = 16000,
+    channels: int = 1,
+    lead_in_seconds: float = 0.0,
+) -> int:
+    """Write a TTS HTTP response to out_path chunk by chunk; returns bytes received.
+
+    Anything other than a WAV is treated as 16-bit little-endian PCM: the header
+    and lead-in silence are written first, the PCM is appended as it arrives
+    (trailing partial frame dropped) and the two size fields are patched at the end.
+    WAV responses are copied as-is and get the silence shifted in afterwards.
+    """
+    head = resp.read(12)
+    if not head:
+        return 0
+    received = len(head)
+
+    if _is_valid_wav_header(head):
+        with open(out_path, "wb") as f:
+            f.write(head)
+            while chunk := resp.read(_STREAM_CHUNK_BYTES):
+                f.write(chunk)
+                received += len(chunk)
+        _prepend_silence_inplace(out_path, silence_seconds=lead_in_seconds)
+        return received
+
     sampwidth = 2
     frame_size = channels * sampwidth
-    if frame_size <= 0:
-        raise ValueError("Invalid frame size")
-    if len(pcm_bytes) % frame_size != 0:
-        pcm_bytes = pcm_bytes[: len(pcm_bytes) - (len(pcm_bytes) % frame_size)]
-    with wave.open(out_path, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sampwidth)
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm_bytes)
+    silence_len = max(0, int(round(lead_in_seconds * sample_rate))) * frame_size
+    with open(out_path, "wb") as f:
+        f.write(_wav_header(0, sample_rate, channels, sampwidth) + b"\x00" * silence_len)
+        data_size = silence_len
+        pending = head
+        while True:
+            usable = len(pending) - (len(pending) % frame_size)
+            if usable:
+                f.write(pending[:usable])
+                data_size += usable
+            chunk = resp.read(_STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            received += len(chunk)
+            pending = pending[usable:] + chunk if usable < len(pending) else chunk
+        f.seek(4)
+        f.write(struct.pack("<I", 36 + data_size))
+        f.seek(40)
+        f.write(struct.pack("<I", data_size))
+    return received
 
 
 def _is_valid_wav_header(raw: bytes) -> bool:
     return isinstance(raw, (bytes, bytearray)) and len(raw) >= 12 and raw[0:4] == b"RIFF" and raw[8:12] == b"WAVE"
 
 
+def _find_wav_data_chunk(f) -> tuple[int, int]:
+    """Return (offset of the 'data' size field, data size) for an open RIFF/WAVE file."""
+    f.seek(12)
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            raise ValueError("WAV file has no data chunk")
+        chunk_id = hdr[0:4]
+        chunk_size = struct.unpack("<I", hdr[4:8])[0]
+        if chunk_id == b"data":
+            return f.tell() - 4, chunk_size
+        f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
 def _prepend_silence_inplace(wav_path: str, silence_seconds: float) -> None:
     if silence_seconds <= 0:
         return
 
-    tmp_path = wav_path + ".tmp"
     with wave.open(wav_path, "rb") as r:
         n_channels = r.getnchannels()
         sampwidth = r.getsampwidth()
         framerate = r.getframerate()
-        n_frames = r.getnframes()
-        audio_frames = r.readframes(n_frames)
 
     silence_frames = int(round(silence_seconds * float(framerate)))
     if silence_frames <= 0:
         return
 
-    silence_bytes = (b"\x00" * sampwidth) * n_channels * silence_frames
+    silence_len = sampwidth * n_channels * silence_frames
+    block = 1 << 20
+
+    # Shift everything after the data header forward by silence_len (copying from
+    # the end so nothing is overwritten), zero-fill the gap, then patch sizes.
+    # No temp file and no full in-memory copy of the audio.
+    with open(wav_path, "r+b") as f:
+        size_pos, data_size = _find_wav_data_chunk(f)
+        data_start = size_pos + 4
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > data_start:
+            n = min(block, pos - data_start)
+            pos -= n
+            f.seek(pos)
+            buf = f.read(n)
+            f.seek(pos + silence_len)
+            f.write(buf)
+        f.seek(data_start)
+        remaining = silence_len
+        while remaining > 0:
+            n = min(block, remaining)
+            f.write(b"\x00" * n)
+            remaining -= n
+        f.seek(size_pos)
+        f.write(struct.pack("<I", data_size + silence_len))
+        f.seek(4)
+        f.write(struct.pack("<I", end + silence_len - 8))
+
+
+def _voice_cache_key(voice_id: str, model_id: str, output_format: str, voice_settings: dict, script: str) -> str:
+    raw = "|".join(
+        [
+            voice_id,
+            model_id,
+            output_format,
+            json.dumps(voice_settings, sort_keys=True),
+            str(VOICE_LEAD_IN_SILENCE_SECONDS),
+            script,
+        ]
+    )
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _prune_voice_cache(cache_dir: str, max_bytes: int = VOICE_CACHE_MAX_BYTES) -> None:
+    # Size-bounded LRU by mtime (hits refresh mtime). Caller holds _voice_cache_lock.
+    global _voice_cache_bytes
+    try:
+        entries = []
+        with os.scandir(cache_dir) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith(".wav"):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    _voice_cache_bytes = total
+
 
-    with wave.open(tmp_path, "wb") as w:
-        w.setnchannels(n_channels)
-        w.setsampwidth(sampwidth)
-        w.setframerate(framerate)
-        w.writeframes(silence_bytes)
-        w.writeframes(audio_frames)
+def _ensure_voice_cache_scanned(cache_dir: str) -> None:
+    with _voice_cache_lock:
+        if _voice_cache_bytes is None:
+            _prune_voice_cache(cache_dir)
 
-    os.replace(tmp_path, wav_path)
+
+def _store_in_voice_cache(wav_path: str, cache_path: str) -> None:
+    global _voice_cache_bytes
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    except OSError:
+        return
+    os.close(fd)
+    try:
+        shutil.copyfile(wav_path, tmp)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    with _voice_cache_lock:
+        _voice_cache_bytes = (_voice_cache_bytes or 0) + size
+        if _voice_cache_bytes > VOICE_CACHE_MAX_BYTES:
+            _prune_voice_cache(cache_dir)
 
 
 def get_wav_duration_seconds(wav_path: str) -> float:
@@ -244,55 +504,65 @@ def generate_voice_with_duration(voice_script: str, voice_style: dict | None = N
 
     # Request PCM and wrap as WAV locally for consistent single-file output.
     output_format = os.getenv("ELEVENLABS_OUTPUT_FORMAT", "pcm_16000")
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}?output_format={output_format}"
+
+    cache_dir = os.path.join(audio_dir, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    _ensure_voice_cache_scanned(cache_dir)
+    cache_path = os.path.join(
+        cache_dir, _voice_cache_key(voice_id, model_id, output_format, voice_settings, voice_script) + ".wav"
+    )
+    if os.path.isfile(cache_path):
+        shutil.copyfile(cache_path, wav_path)
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        _log("Audio reused from cache (.wav)")
+        duration = get_wav_duration_seconds(wav_path)
+        _log(f"Audio duration: {duration:.2f}s")
+        return wav_path, duration
+
+    path = f"/v1/text-to-speech/{voice_id}?output_format={output_format}"
     payload = {
         "text": voice_script,
         "model_id": model_id,
         "language_code": "fr",
         "voice_settings": voice_settings,
     }
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "xi-api-key": ELEVENLABS_API_KEY,
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
 
     try:
-        with urllib.request.urlopen(req) as resp:
-            audio_bytes = resp.read()
-    except urllib.error.HTTPError as e:
-        body = ""
-        try:
-            body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            body = ""
+        received = _elevenlabs_post(
+            path,
+            json.dumps(payload).encode("utf-8"),
+            headers={
+                "xi-api-key": ELEVENLABS_API_KEY,
+                "Content-Type": "application/json",
+            },
+            # Default ElevenLabs PCM output: 16kHz mono, 16-bit little-endian.
+            # The 0.3–0.5s lead-in silence is written ahead of the voice in the same pass.
+            on_ok=lambda resp: _stream_tts_response_to_wav(
+                resp,
+                wav_path,
+                sample_rate=16000,
+                channels=1,
+                lead_in_seconds=VOICE_LEAD_IN_SILENCE_SECONDS,
+            ),
+        )
+    except _ElevenLabsHTTPError as e:
         if e.code == 401:
             key_len = len(ELEVENLABS_API_KEY or "")
             raise RuntimeError(
                 "ElevenLabs Text-to-Speech authentication failed (HTTP 401 Unauthorized). "
                 "The server rejected ELEVENLABS_API_KEY. "
                 "Double-check the key value (no extra quotes/spaces) and account permissions. "
-                f"(key length={key_len}) Response body: {body}"
+                f"(key length={key_len}) Response body: {e.body}"
             )
-        raise RuntimeError(f"ElevenLabs TTS failed: HTTP {e.code} {e.reason} {body}")
+        raise RuntimeError(f"ElevenLabs TTS failed: HTTP {e.code} {e.reason} {e.body}")
 
-    if not audio_bytes:
+    if not received:
         raise RuntimeError("ElevenLabs TTS returned empty audio")
 
-    # If API returns WAV bytes, save directly; otherwise assume PCM and wrap.
-    if _is_valid_wav_header(audio_bytes):
-        with open(wav_path, "wb") as f:
-            f.write(audio_bytes)
-    else:
-        # Default ElevenLabs PCM output: 16kHz mono, 16-bit little-endian.
-        _write_wav_from_pcm(wav_path, pcm_bytes=audio_bytes, sample_rate=16000, channels=1)
-
-    # Add a short silence before the voice starts (0.3–0.5s).
-    _prepend_silence_inplace(wav_path, silence_seconds=VOICE_LEAD_IN_SILENCE_SECONDS)
+    _store_in_voice_cache(wav_path, cache_path)
 
     _log("Audio generated (.wav)")
     duration = get_wav_duration_seconds(wav_path)
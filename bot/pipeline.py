@@ -1,27 +1,57 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from collections import deque
 from pathlib import Path
 import threading
 
-from bot.generators.story_generator import generate_story
+try:
+    import orjson  # optional: faster JSONL encoding for the signature log
+except ImportError:
+    orjson = None
+
+from bot.generators.image_generator import generate_image_openai
+from bot.generators.story_generator import RecentSignatures, _normalize_signature, generate_story
 from bot.generators.subtitle_generator import generate_subtitles
 from bot.generators.voice_generator import VOICE_LEAD_IN_SILENCE_SECONDS, generate_voice_with_duration
-from bot.generators.video_generator import generate_video
+from bot.generators.video_generator import _visual_fingerprint, generate_video
 
 
-_RECENT_VISUAL_SIGNATURES: deque[dict] = deque(maxlen=3)
+_RECENT_VISUAL_SIGNATURES = RecentSignatures(maxlen=3)
 _RECENT_SIG_LOCK = threading.Lock()
-_RECENT_SIG_FILE = Path(__file__).resolve().parent.parent / "storage" / "recent_visual_signatures.json"
+_RECENT_SIG_FILE = Path(__file__).resolve().parent.parent / "storage" / "recent_visual_signatures.jsonl"
+_LEGACY_RECENT_SIG_FILE = _RECENT_SIG_FILE.with_suffix(".json")
+# Append-only log; compacted to the last 3 entries once it grows past this.
+_RECENT_SIG_MAX_LINES = 30
+_recent_sig_lines = 0
+_IMAGES_DIR = Path(__file__).resolve().parent.parent / "storage" / "images"
+_IMAGE_MODEL = "dall-e-3"
+_IMAGE_SIZE = "1024x1792"
+
+
+def _jsonl_line(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
 
 
 def _load_recent_visual_signatures() -> None:
+    global _recent_sig_lines
     try:
-        if not _RECENT_SIG_FILE.exists():
-            return
-        raw = _RECENT_SIG_FILE.read_text(encoding="utf-8")
-        payload = json.loads(raw)
-        if not isinstance(payload, list):
+        if _RECENT_SIG_FILE.exists():
+            lines = _RECENT_SIG_FILE.read_text(encoding="utf-8").splitlines()
+            _recent_sig_lines = len(lines)
+            payload = []
+            for line in lines[-3:]:
+                try:
+                    payload.append(json.loads(line))
+                except ValueError:
+                    continue
+        elif _LEGACY_RECENT_SIG_FILE.exists():
+            payload = json.loads(_LEGACY_RECENT_SIG_FILE.read_text(encoding="utf-8"))
+            if not isinstance(payload, list):
+                return
+        else:
             return
         cleaned = [x for x in payload if isinstance(x, dict)][-3:]
         _RECENT_VISUAL_SIGNATURES.clear()
@@ -30,24 +60,31 @@ def _load_recent_visual_signatures() -> None:
         return
 
 
-def _save_recent_visual_signatures() -> None:
+def _append_recent_visual_signature(sig: dict) -> None:
+    """Persist one signature as a JSONL line; caller holds _RECENT_SIG_LOCK."""
+    global _recent_sig_lines
     try:
         _RECENT_SIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        payload = list(_RECENT_VISUAL_SIGNATURES)[-3:]
-        tmp = _RECENT_SIG_FILE.with_suffix(".tmp")
-        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
-        tmp.replace(_RECENT_SIG_FILE)
+        if _recent_sig_lines >= _RECENT_SIG_MAX_LINES:
+            # Amortized compaction: rewrite with the in-memory last 3 (sig already appended there).
+            tmp = _RECENT_SIG_FILE.with_suffix(".tmp")
+            tmp.write_bytes(b"".join(_jsonl_line(x) for x in _RECENT_VISUAL_SIGNATURES))
+            tmp.replace(_RECENT_SIG_FILE)
+            _recent_sig_lines = len(_RECENT_VISUAL_SIGNATURES)
+            return
+        with open(_RECENT_SIG_FILE, "ab") as f:
+            f.write(_jsonl_line(sig))
+            f.flush()
+            os.fsync(f.fileno())
+        _recent_sig_lines += 1
     except Exception:
         return
 
 
-def _validate_visual_signature_unique(sig: dict, recent: list[dict]) -> None:
-    keys = ["location", "camera_angle", "framing", "lighting", "time", "posture"]
-    for prev in recent[-3:]:
-        diffs = 0
-        for k in keys:
-            if str(sig.get(k) or "").strip().lower() != str(prev.get(k) or "").strip().lower():
-                diffs += 1
+def _validate_visual_signature_unique(sig: dict, recent_normalized: list[tuple]) -> None:
+    s = _normalize_signature(sig)
+    for prev in recent_normalized[-3:]:
+        diffs = sum(1 for a, b in zip(s, prev) if a != b)
         if diffs < 3:
             raise ValueError(f"visual_signature not unique enough (diff_fields={diffs}, need>=3)")
 
@@ -71,7 +108,7 @@ def generate_one_clip(
 ) -> ClipResult:
     forced_gender = voice_mode if voice_mode in {"male", "female"} else None
     with _RECENT_SIG_LOCK:
-        recent = list(_RECENT_VISUAL_SIGNATURES)
+        recent = _RECENT_VISUAL_SIGNATURES.snapshot()
 
     story_obj = generate_story(
         log_fn=log_fn,
@@ -84,27 +121,21 @@ def generate_one_clip(
     if voice_mode in {"male", "female"} and isinstance(story_obj.get("voice"), dict):
         story_obj["voice"]["gender"] = voice_mode
 
-    visual_fingerprint = json.dumps(story_obj["visual"], sort_keys=True, separators=(",", ":"))
-
-    voice_script = str(story_obj["voice_script"]).strip()
-    voice_style = story_obj.get("voice")
-    audio_path, audio_duration = generate_voice_with_duration(voice_script, voice_style=voice_style, log_fn=log_fn)
-
-    subtitle_path = generate_subtitles(
-        story_obj["story"],
-        audio_duration_seconds=audio_duration,
-        start_offset_seconds=VOICE_LEAD_IN_SILENCE_SECONDS,
-    )
+    visual_fingerprint = _visual_fingerprint(story_obj["visual"])
 
+    # Local check first: fail before spending any voice/image API call.
     visual_signature = story_obj.get("visual_signature")
     if isinstance(visual_signature, dict):
         if callable(log_fn):
             log_fn("IMAGE", f"Visual signature: {json.dumps(visual_signature, ensure_ascii=False)}")
         with _RECENT_SIG_LOCK:
-            _validate_visual_signature_unique(visual_signature, list(_RECENT_VISUAL_SIGNATURES))
+            _validate_visual_signature_unique(visual_signature, _RECENT_VISUAL_SIGNATURES.normalized())
         if callable(log_fn):
             log_fn("IMAGE", "Visual signature validated (unique)")
 
+    voice_script = str(story_obj["voice_script"]).strip()
+    voice_style = story_obj.get("voice")
+
     # Strengthen diversity instruction for DALL·E (prompt-only; video pipeline unchanged).
     image_prompt = str(story_obj["image_prompt"]).strip()
     image_prompt += (
@@ -113,20 +144,41 @@ def generate_one_clip(
         "Change location/camera_angle/framing/lighting/time/posture."
     )
 
+    # Voice (ElevenLabs) and image (OpenAI) only depend on the story: run them concurrently.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        voice_future = ex.submit(generate_voice_with_duration, voice_script, voice_style, log_fn)
+        image_future = ex.submit(
+            generate_image_openai,
+            image_prompt=image_prompt,
+            images_dir=str(_IMAGES_DIR),
+            model=_IMAGE_MODEL,
+            size=_IMAGE_SIZE,
+            response_format="b64_json",
+            log_fn=log_fn,
+        )
+        audio_path, audio_duration = voice_future.result()
+        image_path = image_future.result()
+
+    subtitle_path = generate_subtitles(
+        story_obj["story"],
+        audio_duration_seconds=audio_duration,
+        start_offset_seconds=VOICE_LEAD_IN_SILENCE_SECONDS,
+    )
+
     video_path = generate_video(
         audio_path,
         subtitle_path,
         story_obj["visual"],
-        image_path=None,
-        image_prompt=image_prompt,
+        image_path=image_path,
         expected_visual_fingerprint=visual_fingerprint,
         log_fn=log_fn,
+        audio_duration_seconds=audio_duration,
     )
 
     if isinstance(visual_signature, dict):
         with _RECENT_SIG_LOCK:
             _RECENT_VISUAL_SIGNATURES.append(visual_signature)
-            _save_recent_visual_signatures()
+            _append_recent_visual_signature(visual_signature)
 
     return ClipResult(
         video_path=video_path,
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PlatformSpec:
     platform: str
     label: str
@@ -11,21 +14,26 @@ class PlatformSpec:
     help_text: str
 
 
-_PLATFORM_SPECS: dict[str, PlatformSpec] = {
-    "snap": PlatformSpec(
-        platform="snap",
-        label="Snap",
-        # Telegram URL buttons do NOT allow custom schemes like "snapchat://".
-        # Use an HTTPS universal link that opens the Snapchat app on mobile.
-        deeplink="https://www.snapchat.com/",
-        help_text="Snap ouvert → importer la vidéo → coller le texte → publier",
-    ),
-}
+# Identifier-like literals are interned by the compiler, so callers passing the
+# literal "snap" hand us this very object.
+_SNAP = "snap"
 
+_SNAP_SPEC = PlatformSpec(
+    platform=_SNAP,
+    label="Snap",
+    # Telegram URL buttons do NOT allow custom schemes like "snapchat://".
+    # Use an HTTPS universal link that opens the Snapchat app on mobile.
+    deeplink="https://www.snapchat.com/",
+    help_text="Snap ouvert → importer la vidéo → coller le texte → publier",
+)
 
-def get_platform_spec(platform: str) -> PlatformSpec:
-    p = (platform or "").strip().lower()
-    return _PLATFORM_SPECS.get(p) or PlatformSpec(
+_PLATFORM_SPECS: Mapping[str, PlatformSpec] = MappingProxyType({_SNAP: _SNAP_SPEC})
+
+
+@lru_cache(maxsize=32)
+def _fallback_platform_spec(p: str) -> PlatformSpec:
+    # Bounded: platform names can come from user input.
+    return PlatformSpec(
         platform=p or "unknown",
         label=(p or "App").capitalize(),
         deeplink="",
@@ -33,26 +41,49 @@ def get_platform_spec(platform: str) -> PlatformSpec:
     )
 
 
+def get_platform_spec(platform: str) -> PlatformSpec:
+    if platform is _SNAP:
+        return _SNAP_SPEC
+    # Keys are already normalized: an exact hit needs no strip()/lower() copies.
+    spec = _PLATFORM_SPECS.get(platform)
+    if spec is not None:
+        return spec
+    p = (platform or "").strip().lower()
+    return _PLATFORM_SPECS.get(p) or _fallback_platform_spec(p)
+
+
+def _clean_hashtag(t) -> str:
+    s = str(t).strip()
+    if not s or s[0] == "#":
+        return s
+    return f"#{s}"
+
+
 def normalize_hashtags(tags: list[str] | None, *, max_tags: int = 10) -> list[str]:
-    out: list[str] = []
-    seen: set[str] = set()
-    for t in tags or []:
-        s = str(t).strip()
-        if not s:
-            continue
-        if not s.startswith("#"):
-            s = "#" + s
+    if not tags:
+        return []
+    # Case-insensitive dedupe; dict keeps first-seen order and spelling.
+    seen: dict[str, str] = {}
+    for s in filter(None, map(_clean_hashtag, tags)):
         key = s.lower()
         if key in seen:
             continue
-        seen.add(key)
-        out.append(s)
-        if len(out) >= max_tags:
+        seen[key] = s
+        if len(seen) >= max_tags:
             break
-    return out
+    return list(seen.values())
+
 
+_DESC_TEMPLATES: tuple[str, ...] = (
+    "Tu as vu le détail ? 👀",
+    "Regarde bien… quelque chose cloche.",
+    "Ça te paraît normal ?",
+    "Le détail est impossible.",
+    "Une anomalie discrète, mais réelle.",
+)
 
-def _stable_choice(options: list[str], key: str) -> str:
+
+def _stable_choice(options: tuple[str, ...], key: str) -> str:
     if not options:
         return ""
     k = (key or "").encode("utf-8", errors="ignore")
@@ -60,6 +91,13 @@ def _stable_choice(options: list[str], key: str) -> str:
     return options[idx]
 
 
+def _sstrip(v) -> str:
+    """str(v or "").strip() without re-converting values that are already str."""
+    if not v:
+        return ""
+    return (v if type(v) is str else str(v)).strip()
+
+
 def ensure_publish_description(clip) -> str:
     """Return a short description line for publishing.
 
@@ -70,27 +108,23 @@ def ensure_publish_description(clip) -> str:
 
     If clip.publish_desc exists and is empty, it will be set.
     """
+    return _publish_description(clip, None)
+
 
-    snap_hook = str(getattr(clip, "snap_hook", "") or "").strip()
+def _publish_description(clip, title: str | None) -> str:
+    # title: hook_title-or-clip_id when the caller has already resolved it.
+    snap_hook = _sstrip(getattr(clip, "snap_hook", ""))
     if snap_hook:
         return snap_hook
 
-    existing = str(getattr(clip, "publish_desc", "") or "").strip()
+    existing = _sstrip(getattr(clip, "publish_desc", ""))
     if existing:
         return existing
 
-    title = str(getattr(clip, "hook_title", "") or "").strip()
-    if not title:
-        title = str(getattr(clip, "clip_id", "") or "").strip()
+    if title is None:
+        title = _sstrip(getattr(clip, "hook_title", "")) or _sstrip(getattr(clip, "clip_id", ""))
 
-    templates = [
-        "Tu as vu le détail ? 👀",
-        "Regarde bien… quelque chose cloche.",
-        "Ça te paraît normal ?",
-        "Le détail est impossible.",
-        "Une anomalie discrète, mais réelle.",
-    ]
-    desc = _stable_choice(templates, title)
+    desc = _stable_choice(_DESC_TEMPLATES, title)
 
     # Persist only if the clip supports the attribute.
     try:
@@ -102,17 +136,33 @@ def ensure_publish_description(clip) -> str:
 
 
 def build_publish_text_from_clip(clip, *, platform: str = "snap") -> str:
-    title = str(getattr(clip, "hook_title", "") or "").strip() or str(getattr(clip, "clip_id", "") or "").strip()
-    desc = ensure_publish_description(clip)
+    title = _sstrip(getattr(clip, "hook_title", "")) or _sstrip(getattr(clip, "clip_id", ""))
+    desc = _publish_description(clip, title)
     tags = normalize_hashtags(getattr(clip, "hashtags", []) or [])
 
-    parts: list[str] = []
-    parts.append(title)
-    if desc:
-        parts.append(desc)
-    if tags:
-        parts.append(" ".join(tags))
-    return "\n".join(parts).strip()
+    desc_ = f"\n{desc}" if desc else ""
+    tags_ = "\n" + " ".join(tags) if tags else ""
+    return f"{title}{desc_}{tags_}".strip()
+
+
+# Telegram video captions have a max length; keep a safety margin.
+_CAPTION_LIMIT = 950
+_CAPTION_TRUNCATE_AT = 947
+_ELLIPSIS = "…"
+
+
+def _cap_caption(text: str) -> str:
+    if len(text) <= _CAPTION_LIMIT:
+        return text
+    return text[:_CAPTION_TRUNCATE_AT] + _ELLIPSIS
+
+
+_SNAP_TAIL = f"\n\n\n{_SNAP_SPEC.help_text}"
+
+
+def _caption_fast(publish_text: str, help_text: str) -> str:
+    """Common caption shape: publish text + help text, no status/queue lines."""
+    return _cap_caption(f"{publish_text}\n\n\n{help_text}".strip())
 
 
 def build_publish_caption(
@@ -129,31 +179,34 @@ def build_publish_caption(
 
     publish_text = build_publish_text_from_clip(clip, platform=platform)
     spec = get_platform_spec(platform)
-
-    lines: list[str] = []
-    lines.append(publish_text)
-    lines.append("")
-    if status_line:
-        lines.append(status_line)
+    if not status_line and not queue_line:
+        if spec is _SNAP_SPEC:
+            # publish_text is already stripped; the tail is a constant.
+            return _cap_caption(publish_text + _SNAP_TAIL if publish_text else _SNAP_SPEC.help_text)
+        if spec.help_text:
+            return _caption_fast(publish_text, spec.help_text)
+
+    # Same layout as joining [text, "", status, queue, "", help] with newlines.
+    tail = f"\n{status_line}" if status_line else ""
     if queue_line:
-        lines.append(queue_line)
-
+        tail += f"\n{queue_line}"
     # Help text (platform specific) – kept short to avoid caption limits.
-    if spec.help_text:
-        lines.append("")
-        lines.append(spec.help_text)
+    help_ = f"\n\n{spec.help_text}" if spec.help_text else ""
+    text = f"{publish_text}\n{tail}{help_}".strip()
 
-    # Telegram video captions have a max length; keep a safety margin.
-    text = "\n".join([ln for ln in lines if ln is not None]).strip()
-    if len(text) > 950:
-        text = text[:947] + "…"
-    return text
+    return _cap_caption(text)
 
 
 def url_button(text: str, url: str) -> dict:
     return {"text": text, "url": url}
 
 
+# Built once; shared by every caller, so treat it as read-only.
+_SNAP_REPLY_MARKUP: dict | None = (
+    {"inline_keyboard": [[url_button("📤 Ouvrir Snapchat", _SNAP_SPEC.deeplink)]]} if _SNAP_SPEC.deeplink else None
+)
+
+
 def handle_publish_snap(clip_id: str) -> tuple[str, dict | None]:
     """Reusable helper for Telegram publish assistance.
 
@@ -162,9 +215,4 @@ def handle_publish_snap(clip_id: str) -> tuple[str, dict | None]:
     """
 
     _ = clip_id  # reserved for future per-clip behavior
-    spec = get_platform_spec("snap")
-    if spec.deeplink:
-        reply_markup = {"inline_keyboard": [[url_button("📤 Ouvrir Snapchat", spec.deeplink)]]}
-    else:
-        reply_markup = None
-    return spec.help_text, reply_markup
+    return _SNAP_SPEC.help_text, _SNAP_REPLY_MARKUP
@@ -1,11 +1,29 @@
+import atexit
+import io
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import sys
 import time
 import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable
 import uuid
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # optional: faster state/markup encoding
+except ImportError:
+    orjson = None
 
 from bot.config import TELEGRAM_BOT_TOKEN
 from bot.pipeline import ClipResult, generate_one_clip
@@ -21,23 +39,45 @@ from bot.telegram.publish_assist import (
 THEMES = ["injustice", "malaise", "trahison"]
 
 STATE_VERSION = 1
+# Guards _CHAT membership only; each chat's file write takes that chat's own lock.
 STATE_LOCK = threading.Lock()
-STATE_FILE = Path(__file__).resolve().parent.parent / "storage" / "telegram_state.json"
+_CHAT_LOCKS: dict[int, threading.Lock] = {}
+# One file per chat: a callback only rewrites the chat it touched.
+STATE_DIR = Path(__file__).resolve().parent.parent / "storage" / "telegram_state"
+LEGACY_STATE_FILE = Path(__file__).resolve().parent.parent / "storage" / "telegram_state.json"
 VIDEOS_DIR = Path(__file__).resolve().parent.parent / "storage" / "videos"
+try:
+    _VIDEOS_DIR_RESOLVED = VIDEOS_DIR.resolve()
+except Exception:
+    _VIDEOS_DIR_RESOLVED = VIDEOS_DIR
+
+
+# Callers (incl. generation progress callbacks) only enqueue; one listener
+# thread owns stdout, so logging never blocks on the stdout lock.
+_LOGGER = logging.getLogger("bot.telegram_control")
+_LOGGER.setLevel(logging.INFO)
+_LOGGER.propagate = False
+_LOG_Q: queue.SimpleQueue = queue.SimpleQueue()
+_LOGGER.addHandler(logging.handlers.QueueHandler(_LOG_Q))
+_log_stdout = logging.StreamHandler(sys.stdout)
+_log_stdout.setFormatter(logging.Formatter("%(message)s"))
+_LOG_LISTENER = logging.handlers.QueueListener(_LOG_Q, _log_stdout)
+_LOG_LISTENER.start()
+atexit.register(_LOG_LISTENER.stop)
 
 
 def _log(prefix: str, msg: str) -> None:
-    print(f"[{prefix}] {msg}")
+    _LOGGER.info("[%s] %s", prefix, msg)
 
 
-@dataclass
+@dataclass(slots=True)
 class Settings:
     num_clips: int = 5
     themes: list[str] = field(default_factory=lambda: THEMES.copy())
     voice_mode: str = "auto"  # auto | male | female
 
 
-@dataclass
+@dataclass(slots=True)
 class Clip:
     clip_id: str
     video_path: str
@@ -51,7 +91,7 @@ class Clip:
     total: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatState:
     settings: Settings = field(default_factory=Settings)
     clips: dict[str, Clip] = field(default_factory=dict)
@@ -70,13 +110,16 @@ class ChatState:
     gen_detail: str = ""
     gen_last_ui_update_ts: float = 0.0
 
+    # (message_id, text, reply_markup JSON) last shown in the panel; not persisted.
+    last_panel: tuple[int, str, str] | None = None
+
 
 _CHAT: dict[int, ChatState] = {}
 
 
 def _ensure_storage_dir() -> None:
     try:
-        STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
     except Exception:
         pass
 
@@ -96,14 +139,17 @@ def _clip_to_dict(c: Clip) -> dict:
     }
 
 
-def _state_to_dict(st: ChatState) -> dict:
+def _state_to_dict(st: ChatState, *, native_clips: bool = False) -> dict:
+    # orjson encodes Clip dataclasses directly (fields match _clip_to_dict keys),
+    # so its writer can skip building one dict per clip.
+    clips = dict(st.clips) if native_clips else {cid: _clip_to_dict(c) for cid, c in st.clips.items()}
     return {
         "settings": {
             "num_clips": st.settings.num_clips,
             "themes": list(st.settings.themes),
             "voice_mode": st.settings.voice_mode,
         },
-        "clips": {cid: _clip_to_dict(c) for cid, c in st.clips.items()},
+        "clips": clips,
         "ordered_ids": list(st.ordered_ids),
         "approved_ids": list(st.approved_ids),
         "rejected_ids": list(st.rejected_ids),
@@ -144,7 +190,8 @@ def _dict_to_state(d: dict) -> ChatState:
                 total=int(cd.get("total") or 0),
             )
 
-    st.ordered_ids = [str(x) for x in (d.get("ordered_ids") or []) if str(x).strip()]
+    # dict.fromkeys: drop duplicate ids from older state files, keeping order.
+    st.ordered_ids = list(dict.fromkeys(str(x) for x in (d.get("ordered_ids") or []) if str(x).strip()))
     st.approved_ids = [str(x) for x in (d.get("approved_ids") or []) if str(x).strip()]
     st.rejected_ids = [str(x) for x in (d.get("rejected_ids") or []) if str(x).strip()]
 
@@ -153,28 +200,33 @@ def _dict_to_state(d: dict) -> ChatState:
     am = str(d.get("active_menu") or "main")
     st.active_menu = am if am in {"main", "settings", "queue", "approved", "rejected"} else "main"
     st.generating = False
+    _normalize_state(st, rebuild=True)
     return st
 
 
-def _load_state() -> None:
-    if not STATE_FILE.exists():
-        return
-    try:
-        raw = STATE_FILE.read_text(encoding="utf-8")
-        import json as _json_mod
+def _read_json_file(path: Path):
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
 
-        payload = _json_mod.loads(raw)
+
+def _load_legacy_state() -> bool:
+    """Load the old single-file state (all chats); True if anything was loaded."""
+    if not LEGACY_STATE_FILE.exists():
+        return False
+    try:
+        payload = _read_json_file(LEGACY_STATE_FILE)
     except Exception:
-        return
+        return False
 
     if not isinstance(payload, dict):
-        return
+        return False
     if payload.get("version") != STATE_VERSION:
-        return
+        return False
 
     chats = payload.get("chats") or {}
     if not isinstance(chats, dict):
-        return
+        return False
 
     for chat_id_str, st_dict in chats.items():
         try:
@@ -184,67 +236,217 @@ def _load_state() -> None:
         if not isinstance(st_dict, dict):
             continue
         _CHAT[chat_id] = _dict_to_state(st_dict)
+    return bool(_CHAT)
 
 
-def _save_state() -> None:
+def _load_state() -> None:
+    loaded = False
+    if STATE_DIR.is_dir():
+        for path in STATE_DIR.glob("*.json"):
+            try:
+                chat_id = int(path.stem)
+                payload = _read_json_file(path)
+            except Exception:
+                continue
+            if not isinstance(payload, dict) or payload.get("version") != STATE_VERSION:
+                continue
+            st_dict = payload.get("state")
+            if not isinstance(st_dict, dict):
+                continue
+            _CHAT[chat_id] = _dict_to_state(st_dict)
+            loaded = True
+
+    if not loaded and _load_legacy_state():
+        # Migrate: write one file per chat on the next flush.
+        with _dirty_lock:
+            _dirty_chats.update(_CHAT.keys())
+        _STATE_DIRTY.set()
+
+
+def _chat_lock(chat_id: int) -> threading.Lock:
+    lock = _CHAT_LOCKS.get(chat_id)
+    if lock is None:
+        with STATE_LOCK:
+            lock = _CHAT_LOCKS.setdefault(chat_id, threading.Lock())
+    return lock
+
+
+def _save_chat_state(chat_id: int) -> bool:
+    st = _CHAT.get(chat_id)
+    if st is None:
+        return True
     _ensure_storage_dir()
     try:
-        import json as _json_mod
-
-        payload = {
-            "version": STATE_VERSION,
-            "chats": {str(cid): _state_to_dict(st) for cid, st in _CHAT.items()},
-        }
-        tmp = STATE_FILE.with_suffix(".tmp")
-        tmp.write_text(_json_mod.dumps(payload, ensure_ascii=False), encoding="utf-8")
-        tmp.replace(STATE_FILE)
+        path = STATE_DIR / f"{chat_id}.json"
+        tmp = path.with_suffix(".tmp")
+        with _chat_lock(chat_id):
+            if orjson is not None:
+                payload = {"version": STATE_VERSION, "state": _state_to_dict(st, native_clips=True)}
+                tmp.write_bytes(orjson.dumps(payload))
+            else:
+                payload = {"version": STATE_VERSION, "state": _state_to_dict(st)}
+                tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
     except Exception:
         # Never crash the bot due to persistence issues.
-        return
+        return False
+    return True
+
+
+def _save_state() -> bool:
+    """Write every chat marked dirty; failed chats stay dirty."""
+    with _dirty_lock:
+        chat_ids = list(_dirty_chats)
+        _dirty_chats.clear()
+    failed = [cid for cid in chat_ids if not _save_chat_state(cid)]
+    if failed:
+        with _dirty_lock:
+            _dirty_chats.update(failed)
+        return False
+    return True
+
+
+# Mutations only mark their chat dirty; a background flusher coalesces bursts
+# (several saves per callback) into one write per touched chat.
+_STATE_DIRTY = threading.Event()
+_STATE_FLUSH_DELAY_SECONDS = 0.25
+_dirty_chats: set[int] = set()
+_dirty_lock = threading.Lock()
+_flusher_lock = threading.Lock()
+_flusher_started = False
+
+
+def _state_flusher() -> None:
+    while True:
+        _STATE_DIRTY.wait()
+        time.sleep(_STATE_FLUSH_DELAY_SECONDS)
+        _STATE_DIRTY.clear()
+        ok = _save_state()
+        if not ok:
+            # e.g. dict changed size mid-serialization: retry on the next tick.
+            _STATE_DIRTY.set()
+            time.sleep(1.0)
+
+
+def _save_state_locked(chat_id: int | None = None) -> None:
+    """Mark one chat (or all chats when chat_id is None) for the next flush."""
+    global _flusher_started
+    if not _flusher_started:
+        with _flusher_lock:
+            if not _flusher_started:
+                threading.Thread(target=_state_flusher, name="state-flusher", daemon=True).start()
+                _flusher_started = True
+    with _dirty_lock:
+        if chat_id is None:
+            _dirty_chats.update(_CHAT.keys())
+        else:
+            _dirty_chats.add(chat_id)
+    _STATE_DIRTY.set()
 
 
-def _save_state_locked() -> None:
-    with STATE_LOCK:
-        _save_state()
+def _save_state_now(chat_id: int | None = None) -> None:
+    if chat_id is not None:
+        with _dirty_lock:
+            _dirty_chats.add(chat_id)
+    _save_state()
+
 
+@atexit.register
+def _flush_state_at_exit() -> None:
+    if _dirty_chats:
+        _save_state_now()
 
-def _normalize_state(st: ChatState) -> None:
-    st.ordered_ids = [cid for cid in st.ordered_ids if cid in st.clips]
-    st.approved_ids = [cid for cid in st.approved_ids if cid in st.clips]
-    st.rejected_ids = [cid for cid in st.rejected_ids if cid in st.clips]
 
-    # Ensure ids exist in ordered_ids for consistent queue ordering.
-    for cid in st.clips.keys():
-        if cid not in st.ordered_ids:
-            st.ordered_ids.append(cid)
+def _normalize_state(st: ChatState, *, rebuild: bool = False) -> None:
+    # One insertion-ordered dict drops unknown and duplicate ids, then appends any
+    # clip missing from ordered_ids (update() keeps existing keys in place).
+    ordered = dict.fromkeys(cid for cid in st.ordered_ids if cid in st.clips)
+    if len(ordered) != len(st.clips):
+        ordered.update(dict.fromkeys(st.clips))
+    st.ordered_ids = list(ordered)
 
-    # Rebuild approved/rejected from clip status (source of truth).
-    st.approved_ids = [cid for cid, c in st.clips.items() if c.status == "approved"]
-    st.rejected_ids = [cid for cid, c in st.clips.items() if c.status == "rejected"]
+    if rebuild:
+        # Reconcile approved/rejected with clip status (source of truth). Only needed
+        # for state read from disk; status changes go through _set_clip_status.
+        st.approved_ids = _ids_with_status(st, st.approved_ids, "approved")
+        st.rejected_ids = _ids_with_status(st, st.rejected_ids, "rejected")
+
+
+def _ids_with_status(st: ChatState, ids: list[str], status: str) -> list[str]:
+    # Keep the persisted (decision) order: drop ids whose clip no longer has this
+    # status, then append matching clips the list is missing.
+    kept = dict.fromkeys(cid for cid in ids if (c := st.clips.get(cid)) is not None and c.status == status)
+    kept.update(dict.fromkeys(cid for cid, c in st.clips.items() if c.status == status))
+    return list(kept)
+
+
+def _discard_id(ids: list[str], cid: str) -> bool:
+    try:
+        ids.remove(cid)
+    except ValueError:
+        return False
+    return True
+
+
+def _set_clip_status(st: ChatState, clip: Clip, status: str) -> None:
+    """Change a clip's status and move its id between approved_ids/rejected_ids."""
+    prev = clip.status
+    clip.status = status
+    if prev == status:
+        return
+    cid = clip.clip_id
+    # Single scan each: remove() both finds and drops the id.
+    if prev == "approved":
+        _discard_id(st.approved_ids, cid)
+    elif prev == "rejected":
+        _discard_id(st.rejected_ids, cid)
+    if status == "approved":
+        st.approved_ids.append(cid)
+    elif status == "rejected":
+        st.rejected_ids.append(cid)
+
+
+# chat_id -> st_mtime_ns of VIDEOS_DIR at that chat's last import scan.
+_VIDEOS_SCANNED_MTIME: dict[int, int] = {}
 
 
 def _import_existing_videos_into_chat(chat_id: int) -> int:
     st = _state(chat_id)
+    try:
+        dir_mtime = VIDEOS_DIR.stat().st_mtime_ns
+    except OSError:
+        return 0
+    # Adding or removing a file bumps the directory mtime; unchanged means nothing new to import.
+    if _VIDEOS_SCANNED_MTIME.get(chat_id) == dir_mtime:
+        return 0
+
     try:
         existing_paths = {Path(c.video_path).resolve() for c in st.clips.values() if c.video_path}
     except Exception:
         existing_paths = set()
 
-    if not VIDEOS_DIR.exists():
-        return 0
-
     imported = 0
     try:
-        video_files = [p for p in VIDEOS_DIR.glob("*.mp4") if p.is_file()]
-        video_files.sort(key=lambda p: p.stat().st_mtime)
+        # scandir: file type comes from the directory listing and stat() is cached per entry.
+        with os.scandir(VIDEOS_DIR) as it:
+            entries = [e for e in it if e.name.endswith(".mp4") and e.is_file()]
+        entries.sort(key=lambda e: e.stat().st_mtime)
     except Exception:
         return 0
-
-    for p in video_files:
-        try:
-            rp = p.resolve()
-        except Exception:
-            rp = p
+    # Record the mtime taken before the listing only once it succeeded, so a failed
+    # scan is retried and files added mid-scan bump the mtime past it.
+    _VIDEOS_SCANNED_MTIME[chat_id] = dir_mtime
+
+    for e in entries:
+        p = Path(e.path)
+        # Only symlinked entries need realpath; others sit directly in the resolved dir.
+        if e.is_symlink():
+            try:
+                rp = p.resolve()
+            except Exception:
+                rp = p
+        else:
+            rp = _VIDEOS_DIR_RESOLVED / e.name
 
         if rp in existing_paths:
             continue
@@ -270,10 +472,17 @@ def _import_existing_videos_into_chat(chat_id: int) -> int:
 
 
 def _state(chat_id: int) -> ChatState:
-    if chat_id not in _CHAT:
-        _CHAT[chat_id] = ChatState()
-        _save_state_locked()
-    return _CHAT[chat_id]
+    st = _CHAT.get(chat_id)
+    if st is not None:
+        return st
+    with STATE_LOCK:
+        st = _CHAT.get(chat_id)
+        created = st is None
+        if created:
+            st = _CHAT[chat_id] = ChatState()
+    if created:
+        _save_state_locked(chat_id)
+    return st
 
 
 def _pending_ids(st: ChatState) -> list[str]:
@@ -285,14 +494,16 @@ def _pending_ids(st: ChatState) -> list[str]:
     return ids
 
 
-def _queue_position(st: ChatState, clip_id: str) -> tuple[int | None, int]:
-    pending = _pending_ids(st)
-    total = len(pending)
-    try:
-        pos = pending.index(clip_id) + 1
-    except ValueError:
-        pos = None
-    return pos, total
+def _pending_positions(st: ChatState) -> dict[str, int]:
+    """clip_id -> 1-based queue position for every pending clip."""
+    return {cid: i for i, cid in enumerate(_pending_ids(st), start=1)}
+
+
+def _queue_position(st: ChatState, clip_id: str, positions: dict[str, int] | None = None) -> tuple[int | None, int]:
+    # Callers rendering several clips pass one precomputed position map.
+    if positions is None:
+        positions = _pending_positions(st)
+    return positions.get(clip_id), len(positions)
 
 
 def _normalize_hashtags(tags: list[str]) -> list[str]:
@@ -312,6 +523,12 @@ def _normalize_hashtags(tags: list[str]) -> list[str]:
     return out
 
 
+@lru_cache(maxsize=2048)
+def _hashtags_text(tags: tuple[str, ...]) -> str:
+    # Keyed on the tag values, so edits to clip.hashtags never return stale text.
+    return " ".join(_normalize_hashtags(list(tags)))
+
+
 def _display_title(clip: Clip) -> str:
     t = str(clip.hook_title or "").strip()
     return t if t else clip.clip_id
@@ -344,7 +561,7 @@ def _send_next_pending(chat_id: int, after_clip_id: str | None) -> None:
 def _advance_after_action(chat_id: int, current_clip_id: str | None) -> None:
     st = _state(chat_id)
     _normalize_state(st)
-    _save_state_locked()
+    _save_state_locked(chat_id)
 
     # Prefer continuing moderation flow on pending.
     next_id = _next_pending_after(st, current_clip_id)
@@ -382,20 +599,86 @@ def _refresh_menu(chat_id: int) -> None:
         _main_menu(chat_id)
 
 
-def _refresh_pending_positions(chat_id: int) -> None:
+def _start_caption_refresh(chat_id: int, clip: Clip | None = None) -> list[Future]:
+    """Queue caption edits for every pending clip (plus `clip`) on the edit pool."""
     st = _state(chat_id)
-    for cid in _pending_ids(st):
+    positions = _pending_positions(st)
+    total = len(positions)
+    clips: list[Clip] = []
+    for cid, pos in positions.items():
         c = st.clips.get(cid)
-        if c:
-            _edit_clip_message(c)
+        if c is None or c.message_chat_id is None or c.message_id is None:
+            continue
+        last = _last_caption((int(c.message_chat_id), int(c.message_id)))
+        # A refresh only moves the queue line; same position and total means same caption.
+        # The acted-on clip may also have changed status, so it always goes through.
+        if c is not clip and last is not None and last[1] == (pos, total):
+            continue
+        clips.append(c)
+    if clip is not None and clip.clip_id not in positions:
+        clips.append(clip)
+    # Independent edits: overlap them on the shared keep-alive session.
+    return [_EDIT_POOL.submit(_edit_clip_message, c, positions) for c in clips]
+
+
+def _refresh_pending_positions(chat_id: int) -> None:
+    for f in _start_caption_refresh(chat_id):
+        f.result()
+
+
+# One keep-alive session for all Bot API calls (no TLS handshake per request).
+_SESSION = requests.Session()
+# Retry only failed connects: no request reached Telegram yet, so even sendMessage
+# cannot be duplicated. Read/status failures still surface to the caller.
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2),
+    ),
+)
+_EDIT_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tg-edit")
+# Callback acks get their own workers so they never queue behind caption edits.
+_ACK_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tg-ack")
+
 
+class _TokenBucket:
+    """Thread-safe token bucket: acquire() returns at once while tokens remain."""
 
-def _tg_api(method: str, *, params=None, data=None, files=None, timeout=60):
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Telegram allows ~30 outbound messages/s per bot; pace bursts (queue refreshes)
+# up front instead of collecting 429s.
+_TG_BUCKET = _TokenBucket(rate=30.0, capacity=30.0)
+
+
+def _tg_api(method: str, *, params=None, data=None, files=None, headers=None, timeout=60):
     if not TELEGRAM_BOT_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN missing. Put TELEGRAM_BOT_TOKEN=... in .env")
+    if method != "getUpdates":
+        _TG_BUCKET.acquire()
 
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/{method}"
-    resp = requests.post(url, params=params, data=data, files=files, timeout=timeout)
+    resp = _SESSION.post(url, params=params, data=data, files=files, headers=headers, timeout=timeout)
     try:
         payload = resp.json()
     except Exception:
@@ -424,29 +707,37 @@ def _btn(text: str, cb: str):
 
 
 def _json(obj) -> str:
-    # Avoid adding extra deps; requests already brings simplejson sometimes, but use stdlib.
-    import json as _json_mod
+    # Telegram wants reply_markup as a str form field.
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
-    return _json_mod.dumps(obj, ensure_ascii=False)
 
-
-def _send_or_edit_panel(chat_id: int, text: str, reply_markup: dict, *, force_new: bool = False):
+def _send_or_edit_panel(chat_id: int, text: str, reply_markup: dict | str, *, force_new: bool = False):
     st = _state(chat_id)
+    # Static panels pass their markup already serialized.
+    markup_json = reply_markup if isinstance(reply_markup, str) else _json(reply_markup)
     if force_new:
         st.control_message_id = None
-        _save_state_locked()
+        _save_state_locked(chat_id)
     if st.control_message_id is None:
         r = _tg_api(
             "sendMessage",
             data={
                 "chat_id": str(chat_id),
                 "text": text,
-                "reply_markup": _json(reply_markup),
+                "reply_markup": markup_json,
             },
         )
         if r and isinstance(r, dict) and "message_id" in r:
             st.control_message_id = int(r["message_id"])
-            _save_state_locked()
+            st.last_panel = (st.control_message_id, text, markup_json)
+            _save_state_locked(chat_id)
+        return
+
+    # Status ticks often re-render an identical panel: skip the round trip
+    # instead of letting Telegram answer "message is not modified".
+    if st.last_panel == (st.control_message_id, text, markup_json):
         return
 
     try:
@@ -456,9 +747,10 @@ def _send_or_edit_panel(chat_id: int, text: str, reply_markup: dict, *, force_ne
                 "chat_id": str(chat_id),
                 "message_id": str(st.control_message_id),
                 "text": text,
-                "reply_markup": _json(reply_markup),
+                "reply_markup": markup_json,
             },
         )
+        st.last_panel = (st.control_message_id, text, markup_json)
     except RuntimeError as e:
         # If the original control message was deleted or can't be edited anymore,
         # fall back to sending a new panel message.
@@ -473,21 +765,14 @@ def _send_or_edit_panel(chat_id: int, text: str, reply_markup: dict, *, force_ne
             ]
         ):
             st.control_message_id = None
-            _save_state_locked()
+            _save_state_locked(chat_id)
             _send_or_edit_panel(chat_id, text, reply_markup)
             return
         raise
 
 
-def _main_menu(chat_id: int, *, force_new: bool = False):
-    st = _state(chat_id)
-    st.active_menu = "main"
-    _save_state_locked()
-    text = "Control panel"
-    if st.generating:
-        text = _format_generation_status(st)
-
-    reply_markup = _kb(
+_MAIN_MENU_KB_JSON = _json(
+    _kb(
         [
             [_btn("▶️ Launch generation", "menu:launch")],
             [_btn("⚙️ Settings", "menu:settings")],
@@ -496,7 +781,24 @@ def _main_menu(chat_id: int, *, force_new: bool = False):
             [_btn("❌ Rejected clips", "menu:rejected")],
         ]
     )
-    _send_or_edit_panel(chat_id, text, reply_markup, force_new=force_new)
+)
+
+
+def _set_active_menu(chat_id: int, st: ChatState, menu: str) -> None:
+    # Re-rendering the same menu (refreshes after every clip action) changes nothing on disk.
+    if st.active_menu != menu:
+        st.active_menu = menu
+        _save_state_locked(chat_id)
+
+
+def _main_menu(chat_id: int, *, force_new: bool = False):
+    st = _state(chat_id)
+    _set_active_menu(chat_id, st, "main")
+    text = "Control panel"
+    if st.generating:
+        text = _format_generation_status(st)
+
+    _send_or_edit_panel(chat_id, text, _MAIN_MENU_KB_JSON, force_new=force_new)
 
 
 def _format_generation_status(st: ChatState) -> str:
@@ -552,8 +854,7 @@ def _set_generation_status(
 
 def _settings_menu(chat_id: int):
     st = _state(chat_id)
-    st.active_menu = "settings"
-    _save_state_locked()
+    _set_active_menu(chat_id, st, "settings")
 
     themes_txt = ", ".join(st.settings.themes) if st.settings.themes else "(none)"
     text = (
@@ -597,12 +898,12 @@ def _theme_rows_or_empty(theme_rows: list[list[dict]]):
 
 def _list_menu(chat_id: int, which: str):
     st = _state(chat_id)
-    st.active_menu = which
+    _set_active_menu(chat_id, st, which)
     _normalize_state(st)
-    _save_state_locked()
 
+    positions = _pending_positions(st)
     if which == "queue":
-        ids = _pending_ids(st)
+        ids = list(positions)
         title = "Queue"
     elif which == "approved":
         ids = st.approved_ids
@@ -615,7 +916,7 @@ def _list_menu(chat_id: int, which: str):
     shown_ids = ids[:max_items]
 
     # Text summary with title + hashtags
-    lines: list[str] = [f"{title}", f"Count: {len(ids)}"]
+    lines: list[str] = [title, f"Count: {len(ids)}"]
     if len(ids) > max_items:
         lines.append(f"Showing first {max_items} (use actions to move/approve/reject).")
     lines.append("")
@@ -624,18 +925,14 @@ def _list_menu(chat_id: int, which: str):
         c = st.clips.get(cid)
         if not c:
             continue
-        tags = " ".join(_normalize_hashtags(c.hashtags))
-        pos, total = _queue_position(st, cid)
+        tags = _hashtags_text(tuple(c.hashtags or ())) or "(no hashtags)"
+        pos, total = _queue_position(st, cid, positions)
         qp = "-" if pos is None else f"{pos}/{total}" if total else str(pos)
         title_txt = _display_title(c).strip()
         if len(title_txt) > 60:
             title_txt = title_txt[:57] + "…"
-        if tags:
-            lines.append(f"{idx}. {title_txt}  ({c.status})  [#{qp}]")
-            lines.append(f"   {tags}")
-        else:
-            lines.append(f"{idx}. {title_txt}  ({c.status})  [#{qp}]")
-            lines.append("   (no hashtags)")
+        # One entry per clip: both display lines are built in a single format.
+        lines.append(f"{idx}. {title_txt}  ({c.status})  [#{qp}]\n   {tags}")
 
     text = "\n".join(lines)
 
@@ -659,9 +956,9 @@ def _list_menu(chat_id: int, which: str):
     _send_or_edit_panel(chat_id, text, _kb(rows))
 
 
-def _clip_caption(chat_id: int, clip: Clip) -> str:
+def _clip_caption(chat_id: int, clip: Clip, positions: dict[str, int] | None = None) -> str:
     st = _state(chat_id)
-    pos, total = _queue_position(st, clip.clip_id)
+    pos, total = _queue_position(st, clip.clip_id, positions)
     qp = "-" if pos is None else (f"{pos}/{total}" if total else str(pos))
     return build_publish_caption(
         clip,
@@ -671,12 +968,14 @@ def _clip_caption(chat_id: int, clip: Clip) -> str:
     )
 
 
+_SNAP_SPEC = get_platform_spec("snap")
+
+
 def _clip_actions_kb(clip_id: str):
-    spec = get_platform_spec("snap")
     return _kb(
         [
             [
-                url_button("📤 Publier sur Snap", spec.deeplink),
+                url_button("📤 Publier sur Snap", _SNAP_SPEC.deeplink),
                 _btn("📋 Copier texte", f"pub:copy:snap:{clip_id}"),
             ],
             [
@@ -693,6 +992,12 @@ def _clip_actions_kb(clip_id: str):
     )
 
 
+@lru_cache(maxsize=2048)
+def _clip_actions_kb_json(clip_id: str) -> str:
+    # The keyboard only depends on clip_id; serialize it once per clip.
+    return _json(_clip_actions_kb(clip_id))
+
+
 def _list_kind_for_clip(clip: Clip) -> str:
     # queue | approved | rejected
     if clip.status == "approved":
@@ -724,7 +1029,7 @@ def _safe_delete_video_file(video_path: str) -> bool:
     try:
         p = Path(video_path)
         rp = p.resolve()
-        vd = VIDEOS_DIR.resolve()
+        vd = _VIDEOS_DIR_RESOLVED
         if rp == vd or vd not in rp.parents:
             return False
         if rp.is_file():
@@ -748,6 +1053,7 @@ def _delete_clip_and_open_next(chat_id: int, clip_id: str) -> None:
     # Best-effort: delete the video message to keep chat clean.
     try:
         if clip.message_chat_id is not None and clip.message_id is not None:
+            _forget_caption((int(clip.message_chat_id), int(clip.message_id)))
             _tg_api(
                 "deleteMessage",
                 data={
@@ -762,11 +1068,11 @@ def _delete_clip_and_open_next(chat_id: int, clip_id: str) -> None:
     if st.awaiting_edit_clip_id == clip_id:
         st.awaiting_edit_clip_id = None
     st.clips.pop(clip_id, None)
-    st.ordered_ids = [x for x in st.ordered_ids if x != clip_id]
-    st.approved_ids = [x for x in st.approved_ids if x != clip_id]
-    st.rejected_ids = [x for x in st.rejected_ids if x != clip_id]
+    _discard_id(st.ordered_ids, clip_id)
+    _discard_id(st.approved_ids, clip_id)
+    _discard_id(st.rejected_ids, clip_id)
     _normalize_state(st)
-    _save_state_locked()
+    _save_state_locked(chat_id)
 
     # Delete file from disk (safe scope).
     deleted_file = _safe_delete_video_file(clip.video_path)
@@ -812,38 +1118,145 @@ def _edit_cancel_kb():
     return _kb([[_btn("⬅️ Back", "edit:cancel")]])
 
 
+_EDIT_CANCEL_KB_JSON = _json(_edit_cancel_kb())
+
+
+class _MultipartFileBody:
+    """multipart/form-data body whose file part is streamed from disk.
+
+    requests sends objects exposing read() and __len__ block by block with a
+    Content-Length header, whereas files= reads the whole video into memory.
+    """
+
+    def __init__(self, fields: dict[str, str], file_field: str, path: str, content_type: str):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = bytearray()
+        for name, value in fields.items():
+            head += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            head += value.encode("utf-8") + b"\r\n"
+        filename = Path(path).name.replace('"', "")
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        f = open(path, "rb")
+        self._len = len(head) + os.fstat(f.fileno()).st_size + len(tail)
+        self._parts = [io.BytesIO(bytes(head)), f, io.BytesIO(tail)]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def read(self, size: int = -1) -> bytes:
+        out = bytearray()
+        while self._parts and (size < 0 or len(out) < size):
+            chunk = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            out += chunk
+        return bytes(out)
+
+    def __iter__(self):
+        while chunk := self.read(64 * 1024):
+            yield chunk
+
+    def close(self) -> None:
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+
+# (chat_id, message_id) -> (caption, (queue position, queue total)) last sent for
+# that clip message; not persisted. LRU-bounded: an evicted entry only costs one
+# redundant caption edit. Edits run on several threads, hence the lock.
+_LAST_CAPTION: OrderedDict[tuple[int, int], tuple[str, tuple[int | None, int]]] = OrderedDict()
+_LAST_CAPTION_MAX = 1024
+_LAST_CAPTION_LOCK = threading.Lock()
+
+
+def _last_caption(key: tuple[int, int]) -> tuple[str, tuple[int | None, int]] | None:
+    with _LAST_CAPTION_LOCK:
+        last = _LAST_CAPTION.get(key)
+        if last is not None:
+            _LAST_CAPTION.move_to_end(key)
+        return last
+
+
+def _remember_caption(key: tuple[int, int], caption: str, position: tuple[int | None, int]) -> None:
+    with _LAST_CAPTION_LOCK:
+        _LAST_CAPTION[key] = (caption, position)
+        _LAST_CAPTION.move_to_end(key)
+        if len(_LAST_CAPTION) > _LAST_CAPTION_MAX:
+            _LAST_CAPTION.popitem(last=False)
+
+
+def _forget_caption(key: tuple[int, int]) -> None:
+    with _LAST_CAPTION_LOCK:
+        _LAST_CAPTION.pop(key, None)
+
+
 def _send_clip(chat_id: int, clip: Clip):
-    caption = _clip_caption(chat_id, clip)
-    with open(clip.video_path, "rb") as f:
+    positions = _pending_positions(_state(chat_id))
+    caption = _clip_caption(chat_id, clip, positions)
+    body = _MultipartFileBody(
+        {
+            "chat_id": str(chat_id),
+            "caption": caption,
+            "reply_markup": _clip_actions_kb_json(clip.clip_id),
+        },
+        "video",
+        clip.video_path,
+        "video/mp4",
+    )
+    try:
         r = _tg_api(
             "sendVideo",
-            data={
-                "chat_id": str(chat_id),
-                "caption": caption,
-                "reply_markup": _json(_clip_actions_kb(clip.clip_id)),
-            },
-            files={"video": f},
+            data=body,
+            headers={"Content-Type": body.content_type},
             timeout=300,
         )
+    finally:
+        body.close()
     clip.message_chat_id = int(r["chat"]["id"])
     clip.message_id = int(r["message_id"])
-    _save_state_locked()
+    _remember_caption(
+        (clip.message_chat_id, clip.message_id),
+        caption,
+        (positions.get(clip.clip_id), len(positions)),
+    )
+    _save_state_locked(chat_id)
 
 
-def _edit_clip_message(clip: Clip):
+def _edit_clip_message(clip: Clip, positions: dict[str, int] | None = None):
     if clip.message_chat_id is None or clip.message_id is None:
         return
     chat_id = int(clip.message_chat_id)
+    key = (chat_id, int(clip.message_id))
+    if positions is None:
+        positions = _pending_positions(_state(chat_id))
+    caption = _clip_caption(chat_id, clip, positions)
+    last = _last_caption(key)
+    # Most refreshes leave a clip's caption unchanged; skip the round-trip.
+    if last is not None and last[0] == caption:
+        return
     _tg_api(
         "editMessageCaption",
         data={
             "chat_id": str(chat_id),
             "message_id": str(clip.message_id),
-            "caption": _clip_caption(chat_id, clip),
-            "reply_markup": _json(_clip_actions_kb(clip.clip_id)),
+            "caption": caption,
+            "reply_markup": _clip_actions_kb_json(clip.clip_id),
         },
     )
-    _save_state_locked()
+    _remember_caption(key, caption, (positions.get(clip.clip_id), len(positions)))
+    _save_state_locked(chat_id)
+
+
+def _send_clip_and_refresh(chat_id: int, clip: Clip) -> None:
+    _send_clip(chat_id, clip)
+    _refresh_pending_positions(chat_id)
 
 
 def _generate_thread(chat_id: int):
@@ -858,6 +1271,10 @@ def _generate_thread(chat_id: int):
         _set_generation_status(chat_id, force=True)
 
         total = st.settings.num_clips
+        # Upload clip N on a single sender thread while clip N+1 is generated.
+        # One worker keeps Telegram delivery in generation order.
+        sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tg-send")
+        pending_send = None
         for i in range(total):
             try:
                 _log("TELEGRAM", f"Generating clip {i+1}/{total} for chat_id={chat_id}")
@@ -907,203 +1324,250 @@ def _generate_thread(chat_id: int):
                 st.clips[clip_id] = clip
                 st.ordered_ids.append(clip_id)
                 _normalize_state(st)
-                _save_state_locked()
-                _send_clip(chat_id, clip)
-                _set_generation_status(chat_id, stage="Send", detail="Clip sent. Waiting for your decision…", force=True)
-                _refresh_pending_positions(chat_id)
+                _save_state_locked(chat_id)
+                if pending_send is not None:
+                    # Surface a failed previous upload before queueing another.
+                    prev_send, pending_send = pending_send, None
+                    prev_send.result()
+                pending_send = sender.submit(_send_clip_and_refresh, chat_id, clip)
             except Exception as e:
+                if pending_send is not None:
+                    # The previous clip is still uploading; wait for it so its
+                    # error is reported too instead of being dropped.
+                    try:
+                        pending_send.result()
+                    except Exception as send_err:
+                        _tg_api(
+                            "sendMessage",
+                            data={"chat_id": str(chat_id), "text": f"Generation failed: {send_err}"},
+                        )
+                    pending_send = None
                 _tg_api(
                     "sendMessage",
                     data={"chat_id": str(chat_id), "text": f"Generation failed: {e}"},
                 )
                 break
+        if pending_send is not None:
+            try:
+                pending_send.result()
+                _set_generation_status(chat_id, stage="Send", detail="Clip sent. Waiting for your decision…", force=True)
+            except Exception as e:
+                _tg_api(
+                    "sendMessage",
+                    data={"chat_id": str(chat_id), "text": f"Generation failed: {e}"},
+                )
+        sender.shutdown(wait=True)
     finally:
         st.generating = False
         st.gen_stage = ""
         st.gen_detail = ""
         st.gen_clip_index = 0
         st.gen_total = 0
+        _save_state_now(chat_id)
         try:
             _main_menu(chat_id, force_new=True)
         except Exception:
             pass
 
 
-def _handle_callback(chat_id: int, data: str):
+def _cb_main(chat_id: int) -> None:
+    _main_menu(chat_id, force_new=True)
+
+
+def _cb_settings(chat_id: int) -> None:
+    _settings_menu(chat_id)
+
+
+def _cb_queue(chat_id: int) -> None:
+    _list_menu(chat_id, "queue")
+
+
+def _cb_approved(chat_id: int) -> None:
+    _list_menu(chat_id, "approved")
+
+
+def _cb_rejected(chat_id: int) -> None:
+    _list_menu(chat_id, "rejected")
+
+
+def _cb_edit_cancel(chat_id: int) -> None:
     st = _state(chat_id)
+    st.awaiting_edit_clip_id = None
+    _save_state_locked(chat_id)
+    _main_menu(chat_id, force_new=True)
 
-    if data == "menu:main":
-        _main_menu(chat_id, force_new=True)
-        return
 
-    if data.startswith("pub:copy:"):
-        # pub:copy:<platform>:<clip_id>
-        parts = data.split(":")
-        if len(parts) >= 4:
-            platform = parts[2]
-            cid = parts[3]
-        else:
-            platform = "snap"
-            cid = parts[-1] if parts else ""
-        clip = st.clips.get(cid)
-        if clip:
-            # Ensure description exists (V1) and persist it.
-            ensure_publish_description(clip)
-            _save_state_locked()
-            text = build_publish_text_from_clip(clip, platform=platform)
-            _tg_api("sendMessage", data={"chat_id": str(chat_id), "text": text})
-        return
-    if data == "menu:settings":
-        _settings_menu(chat_id)
+def _cb_launch(chat_id: int) -> None:
+    st = _state(chat_id)
+    if st.generating:
         return
+    t = threading.Thread(target=_generate_thread, args=(chat_id,), daemon=True)
+    t.start()
+    _main_menu(chat_id)
 
-    if data == "menu:queue":
-        _list_menu(chat_id, "queue")
-        return
 
-    if data == "menu:approved":
-        _list_menu(chat_id, "approved")
-        return
+def _cb_pub_copy(chat_id: int, arg: str) -> None:
+    # pub:copy:<platform>:<clip_id>
+    platform, sep, cid = arg.partition(":")
+    if not sep:
+        platform, cid = "snap", arg
+    st = _state(chat_id)
+    clip = st.clips.get(cid)
+    if clip:
+        # Ensure description exists (V1) and persist it.
+        ensure_publish_description(clip)
+        _save_state_locked(chat_id)
+        text = build_publish_text_from_clip(clip, platform=platform)
+        _tg_api("sendMessage", data={"chat_id": str(chat_id), "text": text})
 
-    if data == "menu:rejected":
-        _list_menu(chat_id, "rejected")
-        return
 
-    if data == "edit:cancel":
-        st.awaiting_edit_clip_id = None
-        _save_state_locked()
-        _main_menu(chat_id, force_new=True)
-        return
+def _cb_set_num(chat_id: int, arg: str) -> None:
+    st = _state(chat_id)
+    v = int(arg)
+    if v in {5, 10, 20}:
+        st.settings.num_clips = v
+        _save_state_locked(chat_id)
+    _settings_menu(chat_id)
 
-    if data == "menu:launch":
-        if st.generating:
-            return
-        t = threading.Thread(target=_generate_thread, args=(chat_id,), daemon=True)
-        t.start()
-        _main_menu(chat_id)
-        return
 
-    if data.startswith("set:num:"):
-        v = int(data.split(":")[-1])
-        if v in {5, 10, 20}:
-            st.settings.num_clips = v
-            _save_state_locked()
-        _settings_menu(chat_id)
-        return
+def _cb_set_voice(chat_id: int, arg: str) -> None:
+    st = _state(chat_id)
+    if arg in {"auto", "male", "female"}:
+        st.settings.voice_mode = arg
+        _save_state_locked(chat_id)
+    _settings_menu(chat_id)
 
-    if data.startswith("set:voice:"):
-        v = data.split(":")[-1]
-        if v in {"auto", "male", "female"}:
-            st.settings.voice_mode = v
-            _save_state_locked()
-        _settings_menu(chat_id)
-        return
 
-    if data.startswith("set:theme:"):
-        t = data.split(":")[-1]
-        if t in THEMES:
-            if t in st.settings.themes:
-                st.settings.themes = [x for x in st.settings.themes if x != t]
-            else:
-                st.settings.themes.append(t)
-            _save_state_locked()
-        _settings_menu(chat_id)
-        return
+def _cb_set_theme(chat_id: int, arg: str) -> None:
+    st = _state(chat_id)
+    if arg in THEMES:
+        if arg in st.settings.themes:
+            st.settings.themes = [x for x in st.settings.themes if x != arg]
+        else:
+            st.settings.themes.append(arg)
+        _save_state_locked(chat_id)
+    _settings_menu(chat_id)
 
-    if data.startswith("clip:open:"):
-        cid = data.split(":")[-1]
-        clip = st.clips.get(cid)
-        if clip:
-            _send_clip(chat_id, clip)
-        return
 
-    if data.startswith("clip:approve:"):
-        cid = data.split(":")[-1]
-        clip = st.clips.get(cid)
-        if clip:
-            clip.status = "approved"
-            if cid not in st.approved_ids:
-                st.approved_ids.append(cid)
-            if cid in st.rejected_ids:
-                st.rejected_ids.remove(cid)
-            _normalize_state(st)
-            _save_state_locked()
-            _edit_clip_message(clip)
-            _refresh_pending_positions(chat_id)
-            _refresh_menu(chat_id)
-            _advance_after_action(chat_id, cid)
-        return
+def _cb_clip_open(chat_id: int, cid: str) -> None:
+    clip = _state(chat_id).clips.get(cid)
+    if clip:
+        _send_clip(chat_id, clip)
 
-    if data.startswith("clip:reject:"):
-        cid = data.split(":")[-1]
-        clip = st.clips.get(cid)
-        if clip:
-            clip.status = "rejected"
-            if cid not in st.rejected_ids:
-                st.rejected_ids.append(cid)
-            if cid in st.approved_ids:
-                st.approved_ids.remove(cid)
-            _normalize_state(st)
-            _save_state_locked()
-            _edit_clip_message(clip)
-            _refresh_pending_positions(chat_id)
-            _refresh_menu(chat_id)
-            _advance_after_action(chat_id, cid)
-        return
 
-    if data.startswith("clip:later:"):
-        # Move back to pending and place at end of queue.
-        cid = data.split(":")[-1]
-        clip = st.clips.get(cid)
-        if clip:
-            clip.status = "pending"
-        if cid in st.approved_ids:
-            st.approved_ids = [x for x in st.approved_ids if x != cid]
-        if cid in st.rejected_ids:
-            st.rejected_ids = [x for x in st.rejected_ids if x != cid]
-        if cid in st.ordered_ids:
-            st.ordered_ids = [x for x in st.ordered_ids if x != cid]
-            st.ordered_ids.append(cid)
-            _normalize_state(st)
-            _save_state_locked()
-        if clip:
-            _edit_clip_message(clip)
-        _refresh_pending_positions(chat_id)
+def _decide_clip(chat_id: int, cid: str, status: str) -> None:
+    st = _state(chat_id)
+    clip = st.clips.get(cid)
+    if clip:
+        _set_clip_status(st, clip, status)
+        _save_state_locked(chat_id)
+        # Caption edits don't affect message order; run them alongside the panel
+        # refresh and the next clip.
+        edits = _start_caption_refresh(chat_id, clip)
         _refresh_menu(chat_id)
         _advance_after_action(chat_id, cid)
-        return
+        for f in edits:
+            f.result()
+
+
+def _cb_clip_approve(chat_id: int, cid: str) -> None:
+    _decide_clip(chat_id, cid, "approved")
+
+
+def _cb_clip_reject(chat_id: int, cid: str) -> None:
+    _decide_clip(chat_id, cid, "rejected")
 
-    if data.startswith("clip:edit:"):
-        cid = data.split(":")[-1]
-        if cid in st.clips:
-            st.awaiting_edit_clip_id = cid
-            _save_state_locked()
-            _tg_api(
-                "sendMessage",
-                data={
-                    "chat_id": str(chat_id),
-                    "text": "Send the new title, then optionally a second line with hashtags (e.g. #snap #story).",
-                    "reply_markup": _json(_edit_cancel_kb()),
-                },
-            )
-        return
 
-    if data.startswith("clip:delete:"):
-        cid = data.split(":")[-1]
-        _delete_clip_and_open_next(chat_id, cid)
+def _cb_clip_later(chat_id: int, cid: str) -> None:
+    # Move back to pending and place at end of queue.
+    st = _state(chat_id)
+    clip = st.clips.get(cid)
+    if clip:
+        _set_clip_status(st, clip, "pending")
+    # ordered_ids holds each id once, so move it in place without rebuilding the list.
+    if _discard_id(st.ordered_ids, cid):
+        st.ordered_ids.append(cid)
+        _save_state_locked(chat_id)
+    edits = _start_caption_refresh(chat_id, clip)
+    _refresh_menu(chat_id)
+    _advance_after_action(chat_id, cid)
+    for f in edits:
+        f.result()
+
+
+def _cb_clip_edit(chat_id: int, cid: str) -> None:
+    st = _state(chat_id)
+    if cid in st.clips:
+        st.awaiting_edit_clip_id = cid
+        _save_state_locked(chat_id)
+        _tg_api(
+            "sendMessage",
+            data={
+                "chat_id": str(chat_id),
+                "text": "Send the new title, then optionally a second line with hashtags (e.g. #snap #story).",
+                "reply_markup": _EDIT_CANCEL_KB_JSON,
+            },
+        )
+
+
+def _cb_clip_delete(chat_id: int, cid: str) -> None:
+    _delete_clip_and_open_next(chat_id, cid)
+
+
+# Exact callback_data values.
+_CB_LITERAL: dict[str, Callable[[int], None]] = {
+    "menu:main": _cb_main,
+    "menu:settings": _cb_settings,
+    "menu:queue": _cb_queue,
+    "menu:approved": _cb_approved,
+    "menu:rejected": _cb_rejected,
+    "edit:cancel": _cb_edit_cancel,
+    "menu:launch": _cb_launch,
+}
+
+# "<ns>:<action>:<arg>" callback_data, keyed on (ns, action).
+_CB_TABLE: dict[tuple[str, str], Callable[[int, str], None]] = {
+    ("pub", "copy"): _cb_pub_copy,
+    ("set", "num"): _cb_set_num,
+    ("set", "voice"): _cb_set_voice,
+    ("set", "theme"): _cb_set_theme,
+    ("clip", "open"): _cb_clip_open,
+    ("clip", "approve"): _cb_clip_approve,
+    ("clip", "reject"): _cb_clip_reject,
+    ("clip", "later"): _cb_clip_later,
+    ("clip", "edit"): _cb_clip_edit,
+    ("clip", "delete"): _cb_clip_delete,
+}
+
+
+def _handle_callback(chat_id: int, data: str):
+    literal = _CB_LITERAL.get(data)
+    if literal is not None:
+        literal(chat_id)
         return
 
+    # Parse once: namespace, action, then the remaining argument.
+    ns, _, rest = data.partition(":")
+    action, sep, arg = rest.partition(":")
+    handler = _CB_TABLE.get((ns, action)) if sep else None
+    if handler is not None:
+        handler(chat_id, arg)
+
+
+def _import_and_refresh(chat_id: int) -> None:
+    if _import_existing_videos_into_chat(chat_id):
+        _save_state_locked(chat_id)
+        _refresh_menu(chat_id)
+
 
 def _handle_message(chat_id: int, text: str):
     st = _state(chat_id)
     cmd = text.strip().split()[0] if text and text.strip() else ""
     if cmd.startswith("/start"):
-        # Ensure previous generations (videos on disk) are visible after restart
-        # and always send a fresh panel so the menu is visible at the bottom.
-        _import_existing_videos_into_chat(chat_id)
-        _normalize_state(st)
-        _save_state_locked()
+        # Always send a fresh panel so the menu is visible at the bottom, then
+        # pick up previous generations (videos on disk) as this chat's next job.
         _main_menu(chat_id, force_new=True)
+        _submit_update(chat_id, _import_and_refresh)
         return
 
     if cmd == "/queue":
@@ -1141,31 +1605,91 @@ def _handle_message(chat_id: int, text: str):
                 clip.hashtags = tags
 
         st.awaiting_edit_clip_id = None
-        _save_state_locked()
+        _save_state_locked(chat_id)
         _edit_clip_message(clip)
         _refresh_menu(chat_id)
         _tg_api("sendMessage", data={"chat_id": str(chat_id), "text": "Updated."})
 
 
+def _restore_one_chat(chat_id: int) -> None:
+    try:
+        imported = _import_existing_videos_into_chat(chat_id)
+        _normalize_state(_CHAT[chat_id])
+        _save_state_locked(chat_id)
+        _tg_api(
+            "sendMessage",
+            data={
+                "chat_id": str(chat_id),
+                "text": f"✅ Bot prêt. État restauré. Clips importés: {imported}.\nEnvoie /start pour afficher le menu.",
+            },
+        )
+        # Send a fresh panel so the menu is visible at the bottom.
+        _main_menu(chat_id, force_new=True)
+    except Exception:
+        # Don't block startup if a chat can't be notified.
+        pass
+
+
 def _startup_ready_and_restore() -> None:
     # Import existing videos so previous generations appear in Queue after restart.
-    for chat_id in list(_CHAT.keys()):
+    # Chats are independent (disk scan + two API calls each); restore them in parallel.
+    chat_ids = list(_CHAT.keys())
+    if chat_ids:
+        with ThreadPoolExecutor(max_workers=min(8, len(chat_ids)), thread_name_prefix="tg-restore") as ex:
+            list(ex.map(_restore_one_chat, chat_ids))
+    # Persist imported clips before polling starts instead of waiting for the flusher.
+    _save_state_now()
+
+
+# Updates are handled off the polling thread so slow side effects (uploads,
+# caption refreshes) never delay the next getUpdates. Each chat's updates run
+# one at a time, in arrival order; different chats proceed in parallel.
+_UPDATE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tg-update")
+_chat_updates: dict[int, deque] = {}
+_chat_updates_lock = threading.Lock()
+
+
+def _submit_update(chat_id: int, fn: Callable, *args) -> None:
+    with _chat_updates_lock:
+        pending = _chat_updates.get(chat_id)
+        if pending is not None:
+            # A worker is already draining this chat; it will pick this up next.
+            pending.append((fn, args))
+            return
+        _chat_updates[chat_id] = deque([(fn, args)])
+    _UPDATE_POOL.submit(_drain_chat_updates, chat_id)
+
+
+def _drain_chat_updates(chat_id: int) -> None:
+    while True:
+        with _chat_updates_lock:
+            pending = _chat_updates[chat_id]
+            if not pending:
+                del _chat_updates[chat_id]
+                return
+            fn, args = pending.popleft()
         try:
-            imported = _import_existing_videos_into_chat(chat_id)
-            _normalize_state(_CHAT[chat_id])
-            _save_state_locked()
-            _tg_api(
-                "sendMessage",
-                data={
-                    "chat_id": str(chat_id),
-                    "text": f"✅ Bot prêt. État restauré. Clips importés: {imported}.\nEnvoie /start pour afficher le menu.",
-                },
-            )
-            # Send a fresh panel so the menu is visible at the bottom.
-            _main_menu(chat_id, force_new=True)
-        except Exception:
-            # Don't block startup if a chat can't be notified.
-            continue
+            fn(chat_id, *args)
+        except Exception as e:
+            _log("TELEGRAM", f"Update error (chat_id={chat_id}): {e}")
+
+
+# chat_id -> (callback data, arrival time) of the last button press for that chat.
+_LAST_CLICK: dict[int, tuple[str, float]] = {}
+_DUPLICATE_CLICK_WINDOW_S = 0.5
+
+
+def _handle_callback_update(chat_id: int, data: str, received_at: float) -> None:
+    # Double taps arrive as two identical callbacks; the second would redo the same
+    # work (and API calls). Compare arrival times taken by the poller: the drain time
+    # would include however long earlier updates for this chat took. Updates for a
+    # chat run one at a time, so no lock is needed. Only dispatched presses are
+    # recorded, so a run of fast taps cannot keep extending the window.
+    last = _LAST_CLICK.get(chat_id)
+    if last is not None and last[0] == data and received_at - last[1] < _DUPLICATE_CLICK_WINDOW_S:
+        return
+    _LAST_CLICK[chat_id] = (data, received_at)
+    _handle_callback(chat_id, data)
 
 
 def run():
@@ -1181,11 +1705,13 @@ def run():
                 r = _tg_api(
                     "getUpdates",
                     params={
-                        # Keep polling latency low so the bot stays responsive during long generations.
-                        "timeout": "10",
+                        # Long poll: Telegram answers as soon as an update arrives, so a long
+                        # window only cuts idle round-trips. Handlers run off this thread.
+                        "timeout": "50",
+                        "limit": "100",
                         **({"offset": str(offset)} if offset is not None else {}),
                     },
-                    timeout=25,
+                    timeout=60,
                 )
                 for upd in r or []:
                     offset = int(upd["update_id"]) + 1
@@ -1196,18 +1722,18 @@ def run():
                         msg = cq.get("message") or {}
                         chat_id = int((msg.get("chat") or {}).get("id"))
                         if chat_id:
-                            try:
-                                _tg_api("answerCallbackQuery", data={"callback_query_id": cq["id"]})
-                            except Exception:
-                                pass
-                            _handle_callback(chat_id, data)
+                            # Ack right away, not behind this chat's queued updates or pending
+                            # caption edits; the reply is never read, so the future (and any
+                            # error in it) is dropped.
+                            _ACK_POOL.submit(_tg_api, "answerCallbackQuery", data={"callback_query_id": cq["id"]})
+                            _submit_update(chat_id, _handle_callback_update, data, time.monotonic())
                         continue
 
                     msg = upd.get("message")
                     if msg and "text" in msg:
                         chat_id = int((msg.get("chat") or {}).get("id"))
                         if chat_id:
-                            _handle_message(chat_id, str(msg.get("text") or ""))
+                            _submit_update(chat_id, _handle_message, str(msg.get("text") or ""))
 
             except Exception as e:
                 _log("TELEGRAM", f"Polling error: {e}")
@@ -1217,8 +1743,6 @@ def run():
 
 
 if __name__ == "__main__":
-    import os
-    import sys
     if str(os.getenv("RUN_LEGACY_BOT", "")).strip() != "1":
         print("Legacy bot disabled. Use: py -m bot.v3.main (set RUN_LEGACY_BOT=1 to run legacy).", flush=True)
         sys.exit(2)
@@ -25,6 +25,12 @@ import time
 from .android_agent import AndroidAgent, AndroidAgentConfig
 
 
+# Poll delay backs off while the UI is unchanged and resets as soon as it changes.
+_POLL_MIN_S = 0.2
+_POLL_MAX_S = 1.5
+_PROBE_WINDOW_S = 160.0
+
+
 def _make_agent() -> AndroidAgent:
     adb_path = str(os.getenv("V3_ADB_PATH", "adb")).strip() or "adb"
     serial = str(os.getenv("V3_ANDROID_SERIAL", "")).strip() or None
@@ -40,17 +46,31 @@ def main() -> int:
     agent = _make_agent()
 
     print("[AD_PROBE] Starting. Put Instagram on a sponsored reel.", flush=True)
-    print("[AD_PROBE] Looping dumps every 400ms until marker appears...", flush=True)
+    print(
+        f"[AD_PROBE] Looping dumps every {_POLL_MIN_S}-{_POLL_MAX_S}s (backs off while the UI is static) "
+        "until marker appears...",
+        flush=True,
+    )
 
     # We detect via the same production heuristic.
     # When it returns False but sponsor is present, android_agent will now print a hint.
-    for i in range(1, 401):
+    deadline = time.monotonic() + _PROBE_WINDOW_S
+    delay = _POLL_MIN_S
+    last_xml = None
+    i = 0
+    while time.monotonic() < deadline:
+        i += 1
         is_ad = bool(agent.is_probably_ad_reel())
         print(f"[AD_PROBE] tick={i} is_ad={is_ad}", flush=True)
         if is_ad:
             print("[AD_PROBE] DETECTED ad reel", flush=True)
             return 0
-        time.sleep(0.4)
+
+        # The check above already dumped the UI; reuse it as the change signal.
+        xml = getattr(agent, "_last_ui_dump_xml", None)
+        delay = _POLL_MIN_S if xml != last_xml else min(delay * 2, _POLL_MAX_S)
+        last_xml = xml
+        time.sleep(delay)
 
     print("[AD_PROBE] ❌ No ad detected within ~160s", flush=True)
     return 2
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Literal
+from typing import Iterator, Literal
+from xml.parsers import expat
 import html
+import itertools
 import os
 import re
+import queue
 import subprocess
+import threading
 import time
 import unicodedata
 
@@ -26,6 +30,172 @@ class AndroidAgentConfig:
     tap_to_open: bool = True
 
 
+_NODE_TAG_RE = re.compile(r"<node\b[^>]*>")
+_NODE_ATTR_RE = re.compile(r"([\w:-]+)=\"([^\"]*)\"")
+
+
+def _regex_ui_nodes(xml: str) -> Iterator[dict[str, str]]:
+    """Tag-by-tag regex scan; tolerates dumps expat rejects (e.g. surrogate char-refs)."""
+    for m in _NODE_TAG_RE.finditer(xml):
+        yield {k: html.unescape(v) for k, v in _NODE_ATTR_RE.findall(m.group(0))}
+
+
+def _iter_ui_nodes(xml: str, *, chunk_size: int = 65536) -> Iterator[dict[str, str]]:
+    """Yield the attribute dict of each <node> in a UIAutomator dump, in document order.
+
+    expat parses the dump incrementally in C, so a caller that stops early leaves
+    the rest unparsed. Attribute values come back entity-decoded.
+    """
+    start = xml.find("<")
+    if start < 0:
+        return
+    nodes: list[dict[str, str]] = []
+    depth = 0
+    root_closed = False
+
+    def _start(name: str, attrs: dict[str, str]) -> None:
+        nonlocal depth
+        depth += 1
+        if name == "node":
+            nodes.append(attrs)
+
+    def _end(name: str) -> None:
+        nonlocal depth, root_closed
+        depth -= 1
+        if depth == 0:
+            root_closed = True
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = _start
+    parser.EndElementHandler = _end
+    seen = 0
+    try:
+        for i in range(start, len(xml), chunk_size):
+            parser.Parse(xml[i : i + chunk_size], False)
+            seen += len(nodes)
+            yield from nodes
+            nodes.clear()
+        parser.Parse("", True)
+    except expat.ExpatError:
+        # Nodes parsed in the failing chunk before the error are still valid.
+        seen += len(nodes)
+        yield from nodes
+        nodes.clear()
+        if not root_closed:
+            # Malformed inside the hierarchy (older uiautomator writes emoji as
+            # surrogate char-refs): finish with the regex scan from the next node.
+            yield from itertools.islice(_regex_ui_nodes(xml), seen, None)
+        # Otherwise it is the trailing "UI hierchary dumped to" line of exec-out dumps.
+        return
+    yield from nodes
+
+
+class _AdbShell:
+    """One long-lived `adb shell` fed over stdin, instead of one adb process per command.
+
+    Each command is followed by a per-call end marker carrying its exit code, so
+    replies can be split out of the shared stdout stream. A reply that misses its
+    timeout kills the process; the next command respawns it.
+    """
+
+    def __init__(self, base_cmd: list[str]):
+        self._base_cmd = list(base_cmd)
+        self._proc: subprocess.Popen | None = None
+        self._chunks: queue.Queue[bytes] | None = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> subprocess.Popen | None:
+        p = self._proc
+        if p is not None and p.poll() is None:
+            return p
+        try:
+            p = subprocess.Popen(
+                self._base_cmd + ["shell"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception:
+            self._proc = None
+            return None
+        chunks: queue.Queue[bytes] = queue.Queue()
+
+        def _pump(out=p.stdout, q=chunks) -> None:
+            # Reader thread: lets run() wait on stdout with a timeout.
+            try:
+                while True:
+                    b = out.read1(65536)
+                    if not b:
+                        break
+                    q.put(b)
+            except Exception:
+                pass
+            q.put(b"")
+
+        threading.Thread(target=_pump, name="adb-shell-reader", daemon=True).start()
+        self._proc = p
+        self._chunks = chunks
+        return p
+
+    def close(self) -> None:
+        p, self._proc = self._proc, None
+        if p is None:
+            return
+        try:
+            p.kill()
+        except Exception:
+            pass
+
+    def run(self, command: str, *, timeout: float) -> tuple[int, str] | None:
+        """Run `command` in the shared shell; (exit_code, stdout) or None on transport failure/timeout."""
+        with self._lock:
+            p = self._ensure()
+            if p is None or p.stdin is None or self._chunks is None:
+                return None
+            self._seq += 1
+            marker = f"__SNAP_ADB_END_{self._seq}__".encode()
+            # stdin/stderr redirected so a command can neither eat later input nor mix into stdout.
+            line = f"( {command} ) </dev/null 2>/dev/null; printf '\\n%s%d\\n' {marker.decode()} $?\n"
+            try:
+                p.stdin.write(line.encode("utf-8"))
+                p.stdin.flush()
+            except Exception:
+                self.close()
+                return None
+
+            buf = bytearray()
+            deadline = time.monotonic() + float(timeout)
+            tag = b"\n" + marker
+            start = 0
+            while True:
+                i = buf.find(tag, start)
+                if i >= 0:
+                    j = buf.find(b"\n", i + len(tag))
+                    if j >= 0:
+                        try:
+                            rc = int(buf[i + len(tag) : j].strip() or b"1")
+                        except ValueError:
+                            rc = 1
+                        out = bytes(buf[:i]).decode("utf-8", errors="replace").replace("\r\n", "\n")
+                        return rc, out
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    self.close()
+                    return None
+                try:
+                    b = self._chunks.get(timeout=left)
+                except queue.Empty:
+                    continue
+                if not b:
+                    # Shell exited (device gone); next call respawns.
+                    self.close()
+                    return None
+                # Only rescan the tail that could hold a marker split across chunks.
+                start = max(0, len(buf) - len(tag) - 16)
+                buf += b
+
+
 class AndroidAgent:
     """Android device probe, with optional device-visible actions.
 
@@ -54,6 +224,8 @@ class AndroidAgent:
         # Track when we last attempted to navigate to Reels.
         # Used to make dumpsys-based fallbacks safe (bounded in time).
         self._last_open_reels_ts: float = 0.0
+        # Shared `adb shell` for every `shell ...` command (see _run/_run_ok).
+        self._shell = _AdbShell(self._adb_base())
 
     def _uiautomator_dump_xml_quick(self, *, timeout_dump_s: float = 3.5, timeout_cat_s: float = 2.5) -> str:
         """Fast, resilient UIAutomator dump.
@@ -62,23 +234,19 @@ class AndroidAgent:
         The file-based dump is often more reliable, so we try it first with short timeouts.
         """
         # 1) Prefer file-based dump (often more reliable on some ROMs).
-        try:
-            ok = self._run_ok(
-                ["shell", "uiautomator", "dump", "--compressed", "/sdcard/window_dump.xml"],
-                timeout=float(timeout_dump_s),
-            )
-            if ok:
-                out = self._run(["shell", "cat", "/sdcard/window_dump.xml"], timeout=float(timeout_cat_s)) or ""
-                if out and ("<?xml" in out or "<hierarchy" in out):
-                    try:
-                        self._last_ui_dump_ts = float(time.time())
-                        self._last_ui_dump_xml = out
-                        self._last_ui_dump_source = "file"
-                    except Exception:
-                        pass
-                    return out
-        except Exception:
-            pass
+        #    Dump + cat in one round-trip on the persistent shell.
+        res = self._shell.run(
+            "uiautomator dump --compressed /sdcard/window_dump.xml >/dev/null && cat /sdcard/window_dump.xml",
+            timeout=float(timeout_dump_s) + float(timeout_cat_s),
+        )
+        if res is not None:
+            rc, out = res
+            out = out.strip()
+            if rc == 0 and out and ("<?xml" in out or "<hierarchy" in out):
+                self._last_ui_dump_ts = float(time.time())
+                self._last_ui_dump_xml = out
+                self._last_ui_dump_source = "file"
+                return out
 
         # 2) Fallback: stdout dump.
         try:
@@ -171,6 +339,18 @@ class AndroidAgent:
             if not low_raw:
                 return False, "no_xml", 0
 
+            # Fast path: markers are plain ASCII, so a hit on the raw dump is also a hit
+            # after normalization; skip the per-character passes over the whole XML.
+            hit = next((m for m in ad_markers if m in low_raw), "")
+            if hit:
+                if debug_ads:
+                    src = getattr(self, "_last_ui_dump_source", "")
+                    _dbg(
+                        f"ad_marker_hit marker={hit!r} dump={src!r} xml_len={len(xml)} "
+                        f"ctx={_ctx(low_raw, hit)!r}"
+                    )
+                return True, hit, len(low_raw)
+
             # Normalize to improve matching across locales and encoding glitches.
             low = _norm_no_accents(low_raw)
             low_loose = _letters_digits_spaces(low)
@@ -294,12 +474,34 @@ class AndroidAgent:
             cmd += ["-s", self._cfg.serial]
         return cmd
 
+    def _run_shell(self, args: list[str], *, timeout: float, debug: bool) -> tuple[int, str] | None:
+        """Run an `adb shell ...` invocation on the persistent shell.
+
+        adb itself joins shell arguments with spaces for the device shell, so the
+        joined string is exactly what a per-call `adb shell` would have run. A
+        timed-out command is not retried: replaying taps/swipes would repeat input.
+        """
+        res = self._shell.run(" ".join(args[1:]), timeout=timeout)
+        if res is None and debug:
+            print(f"[android][adb] shell_failed_or_timeout cmd={args}", flush=True)
+        elif res is not None and res[0] != 0 and debug:
+            out = res[1].strip()
+            if len(out) > 500:
+                out = out[:500] + "..."
+            print(f"[android][adb] failed rc={res[0]} cmd={args} stdout={out!r}", flush=True)
+        return res
+
     def _run(self, args: list[str], *, timeout: float = 8.0) -> str | None:
         cmd = self._adb_base() + args
         debug = (
             str(os.getenv("V3_ANDROID_DEBUG", "")).strip() == "1"
             or str(os.getenv("V3_DEBUG_ANDROID", "")).strip() == "1"
         )
+        if len(args) > 1 and args[0] == "shell":
+            res = self._run_shell(args, timeout=timeout, debug=debug)
+            if res is None or res[0] != 0:
+                return None
+            return res[1].strip()
         try:
             p = subprocess.run(
                 cmd,
@@ -337,6 +539,9 @@ class AndroidAgent:
             str(os.getenv("V3_ANDROID_DEBUG", "")).strip() == "1"
             or str(os.getenv("V3_DEBUG_ANDROID", "")).strip() == "1"
         )
+        if len(args) > 1 and args[0] == "shell":
+            res = self._run_shell(args, timeout=timeout, debug=debug)
+            return res is not None and res[0] == 0
         try:
             p = subprocess.run(
                 cmd,
@@ -384,14 +589,11 @@ class AndroidAgent:
         if not cleaned:
             return None
 
-        for m in re.finditer(r"<node\b[^>]*>", xml):
-            tag = m.group(0)
-            rid_m = re.search(r"\bresource-id=\"([^\"]*)\"", tag)
-            rid = str(rid_m.group(1) if rid_m else "")
+        for attrs in _iter_ui_nodes(xml):
+            rid = attrs.get("resource-id") or ""
             if not rid:
                 continue
-            bounds_m = re.search(r"\bbounds=\"([^\"]+)\"", tag)
-            bounds = str(bounds_m.group(1) if bounds_m else "").strip()
+            bounds = (attrs.get("bounds") or "").strip()
             if not bounds:
                 continue
             for frag in cleaned:
@@ -410,40 +612,27 @@ class AndroidAgent:
         if not cleaned:
             return None
 
-        # UIAutomator does not guarantee attribute order in <node ...>.
-        # Parse each node tag and match against text/content-desc.
-        node_tags = re.finditer(r"<node\b[^>]*>", xml)
-
-        def _attr(tag: str, name: str) -> str:
-            m = re.search(rf"\b{name}=\"([^\"]*)\"", tag)
-            return str(m.group(1) if m else "")
-
-        # Exact match pass.
-        for m in node_tags:
-            tag = m.group(0)
-            bounds = _attr(tag, "bounds").strip()
+        # One parse: exact matches return immediately, everything else is kept for
+        # the "contains" pass so the dump is not scanned twice.
+        exact = set(cleaned)
+        candidates: list[tuple[str, str]] = []
+        for attrs in _iter_ui_nodes(xml):
+            bounds = (attrs.get("bounds") or "").strip()
             if not bounds:
                 continue
-            text = _attr(tag, "text").strip()
-            desc = _attr(tag, "content-desc").strip()
-            for lab in cleaned:
-                if text == lab or desc == lab:
-                    return bounds
+            text = (attrs.get("text") or "").strip()
+            desc = (attrs.get("content-desc") or "").strip()
+            if text in exact or desc in exact:
+                return bounds
+            candidates.append((bounds, f"{text} {desc}".lower()))
 
         # Contains match pass (case-insensitive).
-        node_tags = re.finditer(r"<node\b[^>]*>", xml)
-        for m in node_tags:
-            tag = m.group(0)
-            bounds = _attr(tag, "bounds").strip()
-            if not bounds:
-                continue
-            text = _attr(tag, "text").strip()
-            desc = _attr(tag, "content-desc").strip()
-            hay = f"{text} {desc}".lower()
+        lowered = [lab.lower() for lab in cleaned]
+        for bounds, hay in candidates:
             if not hay.strip():
                 continue
-            for lab in cleaned:
-                if lab.lower() in hay:
+            for lab in lowered:
+                if lab in hay:
                     return bounds
         return None
 